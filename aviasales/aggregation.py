@@ -0,0 +1,113 @@
+from .columns import FlightRow, from_minor_units
+
+
+class GeneralInfoAccumulator:
+    """Общая информация о перелетах, рассчитываемая за один проход.
+
+    Перелеты добавляются по одному (например, прямо во время разбора ответа партнера), поэтому общая информация
+    готова сразу после добавления последнего перелета. Аккумуляторы объединяются через merge без повторного прохода
+    по перелетам. Границы цены хранятся в минимальных единицах валюты, в general_info они переводятся в Decimal.
+    """
+    # порядок полей совпадает с началом FlightRow
+    border_fields = ('price', 'time', 'transfer_time', 'onward_dep_time', 'onward_arr_time',
+                     'return_dep_time', 'return_arr_time')
+
+    def __init__(self):
+        self.quantity = 0
+        self.airports = set()
+        self.carriers = set()
+        self.n_transfers = set()
+        self._borders = {}
+        # поля, значение которых было None хотя бы у одного перелета
+        self._incomplete = set()
+
+    @classmethod
+    def from_flights(cls, flights):
+        accumulator = cls()
+        accumulator.update(flights)
+        return accumulator
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Общая информация по готовым колонкам FlightsColumns без прохода по перелетам."""
+        accumulator = cls()
+        accumulator.quantity = len(columns)
+        if not len(columns):
+            return accumulator
+        for f_name in cls.border_fields:
+            border = columns.borders(f_name)
+            if border is None:
+                accumulator._incomplete.add(f_name)
+            else:
+                accumulator._borders[f_name] = list(border)
+        accumulator.airports.update(columns.airports)
+        accumulator.carriers.update(columns.carriers)
+        accumulator.n_transfers.update(columns.n_transfers)
+        return accumulator
+
+    def add(self, flight):
+        self.add_row(FlightRow.from_flight(flight))
+
+    def update(self, flights):
+        for flight in flights:
+            self.add(flight)
+
+    def add_row(self, row):
+        """Добавляет перелет по его предвычисленным значениям FlightRow."""
+        self.quantity += 1
+        borders = self._borders
+
+        for f_name, value in zip(self.border_fields, row):
+            if value is None:
+                self._incomplete.add(f_name)
+                continue
+
+            border = borders.get(f_name)
+            if border is None:
+                borders[f_name] = [value, value]
+            elif value < border[0]:
+                border[0] = value
+            elif value > border[1]:
+                border[1] = value
+
+        self.airports.update(row.airports)
+        self.carriers.update(row.carriers)
+        self.n_transfers.add(row.n_transfers)
+
+    def merge(self, other):
+        """Добавляет информацию из другого аккумулятора."""
+        self.quantity += other.quantity
+        self._incomplete.update(other._incomplete)
+
+        for f_name, (other_min, other_max) in other._borders.items():
+            border = self._borders.get(f_name)
+            if border is None:
+                self._borders[f_name] = [other_min, other_max]
+            else:
+                border[0] = min(border[0], other_min)
+                border[1] = max(border[1], other_max)
+
+        self.airports.update(other.airports)
+        self.carriers.update(other.carriers)
+        self.n_transfers.update(other.n_transfers)
+        return self
+
+    def borders(self, field_name):
+        """Минимальное и максимальное значения поля (None, если значение есть не у всех перелетов)."""
+        border = self._borders.get(field_name)
+        if border is None or field_name in self._incomplete:
+            return None
+        return tuple(border)
+
+    @property
+    def general_info(self):
+        general_info = dict(quantity=self.quantity)
+        for f_name in self.border_fields:
+            general_info[f_name] = self.borders(f_name)
+        if general_info['price'] is not None:
+            general_info['price'] = tuple(from_minor_units(price) for price in general_info['price'])
+
+        general_info['airports'] = list(self.airports)
+        general_info['carriers'] = list(self.carriers)
+        general_info['n_transfers'] = list(self.n_transfers)
+        return general_info
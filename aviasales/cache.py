@@ -0,0 +1,149 @@
+import sys
+from collections import Counter
+from itertools import islice
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+from cachetools import TTLCache
+
+# объекты, которые не принадлежат значению в кэше и не учитываются в его размере
+_SHARED_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+
+def _referents(obj):
+    if isinstance(obj, dict):
+        return [item for pair in obj.items() for item in pair]
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return obj
+    referents = [obj.__dict__] if hasattr(obj, '__dict__') else []
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if name not in ('__dict__', '__weakref__') and hasattr(obj, name):
+                referents.append(getattr(obj, name))
+    return referents
+
+
+def deep_getsizeof(obj, seen=None):
+    """Размер объекта в байтах вместе со всеми объектами, на которые он ссылается (каждый учитывается один раз)."""
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        stack.extend(_referents(obj))
+    return size
+
+
+def estimated_size(obj, sample_size=32, seen=None):
+    """Оценка размера объекта в байтах.
+
+    Работает как deep_getsizeof, но для коллекций длиннее sample_size полностью учитывается только выборка
+    элементов, а размер остальных экстраполируется. Стоимость оценки не зависит от числа перелетов.
+
+    Объекты, общие для элементов коллекции и не попавшие в выборку, учитываются только один раз у элементов выборки.
+    Поэтому оценка коллекций, которые ссылаются на объекты других коллекций (Flights.keys - на строки и даты частей
+    маршрутов), завышена: на разобранных Flights с ключами и индексами - до ~25%, без общих объектов оценка почти
+    точна (расхождение в пределах нескольких процентов в обе стороны).
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    referents = _referents(obj)
+    n = len(referents)
+    if n > sample_size:
+        step = n // sample_size
+        sample_sizes = [estimated_size(item, sample_size, seen) for item in islice(referents, 0, None, step)]
+        # общие для элементов объекты (строки кодов, даты) учитываются в первых элементах выборки, поэтому
+        # остальные элементы оцениваются по второй половине выборки, где такие объекты уже учтены
+        marginal = sample_sizes[len(sample_sizes) // 2:]
+        return size + sum(sample_sizes) + (n - len(sample_sizes)) * sum(marginal) // len(marginal)
+    return size + sum(estimated_size(item, sample_size, seen) for item in referents)
+
+
+class MemoryBoundedCache(TTLCache):
+    """TTL кэш с ограничением суммарного размера значений в байтах.
+
+    Размер значения оценивается функцией getsizeof (по умолчанию - estimated_size). При превышении maxsize байт
+    или maxentries записей вытесняются давно не использованные (policy='lru') или редко используемые
+    (policy='lfu') записи. Счетчики попаданий, промахов и вытеснений доступны через stats().
+
+    Если размер значения меняется после записи (например, задача в кэше завершилась), его нужно пересчитать
+    вызовом resize().
+    """
+    POLICIES = ('lru', 'lfu')
+
+    def __init__(self, maxsize, ttl, maxentries=None, policy='lru', getsizeof=estimated_size):
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown eviction policy: {}'.format(policy))
+        super().__init__(maxsize, ttl, getsizeof=getsizeof)
+        self.maxentries = maxentries
+        self.policy = policy
+        self._uses = Counter()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        if key in self:
+            self.hits += 1
+            self._uses[key] += 1
+            return self[key]
+        self.misses += 1
+        return default
+
+    def __setitem__(self, key, value):
+        if self.maxentries is not None and key not in self:
+            while len(self) >= self.maxentries:
+                self.popitem()
+        super().__setitem__(key, value)
+        # ключи удаленных по TTL записей в счетчике использований не нужны
+        if len(self._uses) > 2 * len(self) + 16:
+            self._uses = Counter({k: n for k, n in self._uses.items() if k in self})
+
+    def popitem(self):
+        if self.policy == 'lfu':
+            self.expire()
+            if not len(self):
+                raise KeyError('{} is empty'.format(type(self).__name__))
+            key = min(self, key=lambda k: self._uses[k])
+            item = key, self.pop(key)
+        else:
+            item = super().popitem()
+        self._uses.pop(item[0], None)
+        self.evictions += 1
+        return item
+
+    def resize(self, key, value):
+        """Пересчитывает размер значения, если оно все еще хранится по ключу key.
+
+        Срок жизни записи и ее место в очереди вытеснения не меняются (повторная вставка продлила бы жизнь часто
+        используемой записи бесконечно). При переполнении вытесняются записи по обычной политике.
+        """
+        # размеры хранит базовый cachetools.Cache; обращение без __getitem__, чтобы не менять порядок LRU
+        sizes = self._Cache__size
+        if key not in self or self._Cache__data.get(key) is not value:
+            return
+        size = self.getsizeof(value)
+        if size > self.maxsize:
+            # значение больше всего кэша
+            self.pop(key, None)
+            return
+        self._Cache__currsize += size - sizes[key]
+        sizes[key] = size
+        while self.currsize > self.maxsize:
+            self.popitem()
+
+    def stats(self):
+        return {
+            'entries': len(self),
+            'bytes': self.currsize,
+            'max_bytes': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
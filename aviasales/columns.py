@@ -0,0 +1,160 @@
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_EVEN
+
+EPOCH = datetime(1970, 1, 1)
+# цены в колонках, индексах и общей информации хранятся целым числом минимальных единиц (сотых долей) валюты
+PRICE_EXPONENT = 2
+
+
+def to_timestamp(dt):
+    """Переводит наивный datetime в число секунд от EPOCH."""
+    return int((dt - EPOCH).total_seconds())
+
+
+def from_timestamp(ts):
+    return EPOCH + timedelta(seconds=ts)
+
+
+def to_minor_units(price, rounding=ROUND_HALF_EVEN):
+    """Переводит цену (Decimal) в целое число минимальных единиц валюты."""
+    return int(price.scaleb(PRICE_EXPONENT).to_integral_value(rounding))
+
+
+def from_minor_units(value):
+    """Цена в виде Decimal по числу минимальных единиц валюты."""
+    return Decimal(value).scaleb(-PRICE_EXPONENT)
+
+
+class FlightRow(namedtuple('FlightRow', (
+        'price', 'time', 'transfer_time',
+        'onward_dep_time', 'onward_arr_time', 'return_dep_time', 'return_arr_time',
+        'n_transfers', 'carriers', 'airports'))):
+    """Вычисленные один раз значения свойств перелета; цена - в минимальных единицах валюты."""
+    __slots__ = ()
+
+    @classmethod
+    def from_flight(cls, flight):
+        return cls(flight.price_minor_units, flight.time, flight.transfer_time,
+                   flight.onward_dep_time, flight.onward_arr_time, flight.return_dep_time, flight.return_arr_time,
+                   flight.n_transfers, flight.carriers, flight.airports)
+
+
+class CodeTable:
+    """Таблица интернированных строковых кодов (перевозчики, аэропорты)."""
+    def __init__(self):
+        self._ids = {}
+        self._codes = []
+
+    def id(self, code):
+        code_id = self._ids.get(code)
+        if code_id is None:
+            code_id = self._ids[code] = len(self._codes)
+            self._codes.append(code)
+        return code_id
+
+    def id_or_none(self, code):
+        """Код без добавления в таблицу."""
+        return self._ids.get(code)
+
+    def __getitem__(self, code_id):
+        return self._codes[code_id]
+
+    def __iter__(self):
+        return iter(self._codes)
+
+    def __len__(self):
+        return len(self._codes)
+
+    @classmethod
+    def from_codes(cls, codes):
+        table = cls()
+        for code in codes:
+            table.id(code)
+        return table
+
+
+class FlightsColumns:
+    """Колоночное представление перелетов.
+
+    i-я строка каждой колонки соответствует i-му перелету в Flights. Значения вычисляются один раз при добавлении
+    перелета, поэтому сортировка и агрегация не обращаются к свойствам Flight. Цены хранятся целым числом
+    минимальных единиц валюты (to_minor_units), Decimal нужен только при выводе.
+    """
+    timestamp_fields = ('onward_dep_time', 'onward_arr_time', 'return_dep_time', 'return_arr_time')
+    # все колонки-массивы (например, для сохранения колонок вместе с перелетами)
+    array_fields = ('price', 'time', 'transfer_time', 'n_transfers') + timestamp_fields + (
+        'has_return', 'carrier_ids', 'carrier_offsets', 'airport_ids', 'airport_offsets')
+
+    def __init__(self):
+        self.price = array('q')
+        self.time = array('i')
+        self.transfer_time = array('i')
+        self.n_transfers = array('b')
+
+        self.onward_dep_time = array('q')
+        self.onward_arr_time = array('q')
+        self.return_dep_time = array('q')
+        self.return_arr_time = array('q')
+        self.has_return = array('b')
+
+        self.carriers = CodeTable()
+        self.airports = CodeTable()
+        # списки кодов перелетов хранятся подряд, i-му перелету соответствует срез [offsets[i]:offsets[i+1]]
+        self.carrier_ids = array('H')
+        self.carrier_offsets = array('L', [0])
+        self.airport_ids = array('H')
+        self.airport_offsets = array('L', [0])
+
+    @classmethod
+    def from_flights(cls, flights):
+        columns = cls()
+        for flight in flights:
+            columns.append(flight)
+        return columns
+
+    def __len__(self):
+        return len(self.price)
+
+    def append(self, flight):
+        row = FlightRow.from_flight(flight)
+        self.append_row(row)
+        return row
+
+    def append_row(self, row):
+        self.price.append(row.price)
+        self.time.append(row.time)
+        self.transfer_time.append(row.transfer_time)
+        self.n_transfers.append(row.n_transfers)
+
+        self.onward_dep_time.append(to_timestamp(row.onward_dep_time))
+        self.onward_arr_time.append(to_timestamp(row.onward_arr_time))
+        has_return = row.return_dep_time is not None
+        self.has_return.append(has_return)
+        self.return_dep_time.append(to_timestamp(row.return_dep_time) if has_return else 0)
+        self.return_arr_time.append(to_timestamp(row.return_arr_time) if has_return else 0)
+
+        self.carrier_ids.extend(self.carriers.id(c) for c in row.carriers)
+        self.carrier_offsets.append(len(self.carrier_ids))
+        self.airport_ids.extend(self.airports.id(a) for a in row.airports)
+        self.airport_offsets.append(len(self.airport_ids))
+
+    def flight_carriers(self, ind):
+        ids = self.carrier_ids[self.carrier_offsets[ind]:self.carrier_offsets[ind + 1]]
+        return [self.carriers[i] for i in ids]
+
+    def flight_airports(self, ind):
+        ids = self.airport_ids[self.airport_offsets[ind]:self.airport_offsets[ind + 1]]
+        return [self.airports[i] for i in ids]
+
+    def borders(self, field_name):
+        """Минимальное и максимальное значения колонки (None, если значение есть не у всех перелетов)."""
+        column = getattr(self, field_name)
+        if not column:
+            return None
+        if field_name in self.timestamp_fields:
+            if field_name.startswith('return_') and not all(self.has_return):
+                return None
+            return from_timestamp(min(column)), from_timestamp(max(column))
+        return min(column), max(column)
@@ -0,0 +1,77 @@
+from collections import defaultdict
+
+
+def onward_designators(key):
+    """Перевозчики и номера рейсов маршрута туда (без времени) из ключа перелета."""
+    return tuple(part[:2] for part in key[0])
+
+
+def _rows_by_key(keys):
+    rows = defaultdict(list)
+    for row, key in enumerate(keys):
+        rows[key].append(row)
+    return rows
+
+
+class FlightsDiff:
+    """Отличия между результатами двух поисков.
+
+    Перелеты сопоставляются хеш-соединением по каноническому ключу Flight.key, поэтому сравнение линейно по числу
+    перелетов. Совпавшие перелеты проверяются на изменение цены. Из несовпавших перелетов те, у которых совпадают
+    рейсы маршрута туда, считаются изменившими маршрут (время, обратный маршрут), остальные - добавленными или
+    удаленными.
+    """
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.price_changes = []
+        self.route_changes = []
+        self.unchanged = 0
+
+        old_rows = _rows_by_key(old.keys)
+        unmatched_new = []
+        for new_row, key in enumerate(new.keys):
+            rows = old_rows.get(key)
+            if not rows:
+                unmatched_new.append(new_row)
+                continue
+            old_row = rows.pop(0)
+            if old.columns.price[old_row] != new.columns.price[new_row]:
+                self.price_changes.append((old_row, new_row))
+            else:
+                self.unchanged += 1
+
+        unmatched_old = sorted(row for rows in old_rows.values() for row in rows)
+        old_rows_by_onward = _rows_by_key(onward_designators(old.keys[row]) for row in unmatched_old)
+
+        self.added = []
+        matched_old = set()
+        for new_row in unmatched_new:
+            rows = old_rows_by_onward.get(onward_designators(new.keys[new_row]))
+            if rows:
+                old_row = unmatched_old[rows.pop(0)]
+                matched_old.add(old_row)
+                self.route_changes.append((old_row, new_row))
+            else:
+                self.added.append(new_row)
+        self.removed = [row for row in unmatched_old if row not in matched_old]
+
+    def as_dict(self, serialize_flight):
+        old, new = self.old, self.new
+
+        def change(old_row, new_row):
+            return {
+                'old': serialize_flight(old[old_row]),
+                'new': serialize_flight(new[new_row]),
+                'price_delta': new[new_row].price - old[old_row].price,
+            }
+
+        return {
+            'old_quantity': len(old),
+            'new_quantity': len(new),
+            'unchanged': self.unchanged,
+            'added': [serialize_flight(new[row]) for row in self.added],
+            'removed': [serialize_flight(old[row]) for row in self.removed],
+            'price_changes': [change(*rows) for rows in self.price_changes],
+            'route_changes': [change(*rows) for rows in self.route_changes],
+        }
@@ -35,6 +35,11 @@ class FlightsNotFound(UserException):
     default_message = 'Перелеты не найдены'
 
 
+class InvalidParameter(UserException):
+    """Некорректное значение параметра запроса."""
+    default_message = 'Некорректное значение параметра %s'
+
+
 class TaskError(AviasalesException):
     """Ошибки, связанные с работой с задачами."""
     pass
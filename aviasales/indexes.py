@@ -0,0 +1,100 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+
+def _inverted(ids, offsets):
+    """Обратный индекс: код -> номера перелетов, в списке кодов которых он есть."""
+    rows = defaultdict(lambda: array('L'))
+    for row in range(len(offsets) - 1):
+        for code_id in set(ids[offsets[row]:offsets[row + 1]]):
+            rows[code_id].append(row)
+    return dict(rows)
+
+
+class SortedColumn:
+    """Номера перелетов, упорядоченные по значению колонки, для выборки по диапазону."""
+    def __init__(self, column):
+        self.order = array('L', sorted(range(len(column)), key=column.__getitem__))
+        self.values = array(column.typecode, (column[i] for i in self.order))
+
+    def between(self, low=None, high=None):
+        start = 0 if low is None else bisect_left(self.values, low)
+        stop = len(self.values) if high is None else bisect_right(self.values, high)
+        return self.order[start:stop]
+
+
+class FlightsIndex:
+    """Индексы по колонкам перелетов для фильтрации.
+
+    Строятся один раз для закэшированного списка перелетов. Фильтрация начинается с самого узкого из условий, а
+    остальные условия проверяются по колонкам только для отобранных перелетов, поэтому стоимость выборки
+    пропорциональна размеру результата, а не всего списка.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.by_carrier = _inverted(columns.carrier_ids, columns.carrier_offsets)
+        self.by_airport = _inverted(columns.airport_ids, columns.airport_offsets)
+        self.by_n_transfers = defaultdict(lambda: array('L'))
+        for row, n_transfers in enumerate(columns.n_transfers):
+            self.by_n_transfers[n_transfers].append(row)
+        self.by_n_transfers = dict(self.by_n_transfers)
+        self.price = SortedColumn(columns.price)
+        self.onward_dep_time = SortedColumn(columns.onward_dep_time)
+
+    @staticmethod
+    def _posting(index, keys):
+        rows = [index[key] for key in keys if key in index]
+        if len(rows) == 1:
+            return rows[0]
+        return sorted({row for posting in rows for row in posting})
+
+    def _codes_predicate(self, ids, offsets, code_ids):
+        def predicate(row):
+            return not code_ids.isdisjoint(ids[offsets[row]:offsets[row + 1]])
+        return predicate
+
+    @staticmethod
+    def _range_predicate(column, low, high):
+        def predicate(row):
+            value = column[row]
+            return (low is None or value >= low) and (high is None or value <= high)
+        return predicate
+
+    def select(self, carriers=None, airports=None, n_transfers=None,
+               min_price=None, max_price=None, departure_from=None, departure_to=None):
+        """Номера перелетов (по возрастанию), удовлетворяющих всем заданным условиям.
+
+        carriers, airports и n_transfers - наборы допустимых значений (перелет подходит, если совпадает хотя бы одно),
+        границы цены и времени вылета туда включительные (время - в секундах от EPOCH).
+        """
+        columns = self.columns
+        # условия в виде (кандидаты, проверка отдельного перелета)
+        conditions = []
+
+        if carriers is not None:
+            code_ids = {columns.carriers.id_or_none(c) for c in carriers} - {None}
+            conditions.append((self._posting(self.by_carrier, code_ids),
+                               self._codes_predicate(columns.carrier_ids, columns.carrier_offsets, code_ids)))
+        if airports is not None:
+            code_ids = {columns.airports.id_or_none(a) for a in airports} - {None}
+            conditions.append((self._posting(self.by_airport, code_ids),
+                               self._codes_predicate(columns.airport_ids, columns.airport_offsets, code_ids)))
+        if n_transfers is not None:
+            n_transfers = set(n_transfers)
+            conditions.append((self._posting(self.by_n_transfers, n_transfers),
+                               lambda row: columns.n_transfers[row] in n_transfers))
+        if min_price is not None or max_price is not None:
+            conditions.append((self.price.between(min_price, max_price),
+                               self._range_predicate(columns.price, min_price, max_price)))
+        if departure_from is not None or departure_to is not None:
+            conditions.append((self.onward_dep_time.between(departure_from, departure_to),
+                               self._range_predicate(columns.onward_dep_time, departure_from, departure_to)))
+
+        if not conditions:
+            return range(len(columns))
+
+        conditions.sort(key=lambda condition: len(condition[0]))
+        candidates, _ = conditions[0]
+        predicates = [predicate for _, predicate in conditions[1:]]
+        return sorted(row for row in candidates if all(predicate(row) for predicate in predicates))
@@ -0,0 +1,177 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+from bottle import request, response
+from gevent.local import local
+
+# границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_float(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Histogram:
+    """Гистограмма значений с одной меткой, хранится в памяти процесса."""
+    def __init__(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        # значение метки -> [число значений в каждой корзине (последняя - +Inf), сумма значений]
+        self._series = {}
+
+    def observe(self, label_value, value):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, label_value):
+        series = self._series.get(label_value)
+        return sum(series[0]) if series else 0
+
+    def expose(self):
+        """Строки в текстовом формате Prometheus."""
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        for label_value, (counts, total) in sorted(self._series.items()):
+            label = '{}="{}"'.format(self.label, _escape(label_value))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, label, _format_float(bound), cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, label, _format_float(total)))
+            lines.append('{}_count{{{}}} {}'.format(self.name, label, cumulative))
+        return lines
+
+
+class MetricsRegistry:
+    """Метрики процесса: гистограммы и функции, возвращающие текущие значения счетчиков при запросе метрик."""
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs):
+        histogram = Histogram(*args, **kwargs)
+        self.histograms.append(histogram)
+        return histogram
+
+    def register(self, collector):
+        """collector() возвращает кортежи (имя, тип, описание, значение)."""
+        self.collectors.append(collector)
+        return collector
+
+    def expose(self):
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.expose())
+        for collector in self.collectors:
+            for name, metric_type, documentation, value in collector():
+                lines.append('# HELP {} {}'.format(name, documentation))
+                lines.append('# TYPE {} {}'.format(name, metric_type))
+                lines.append('{} {}'.format(name, _format_float(value)))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+stage_seconds = registry.histogram('aviasales_stage_seconds', 'Время этапов обработки, с', 'stage')
+request_seconds = registry.histogram('aviasales_request_seconds', 'Время обработки запросов, с', 'route')
+
+# этапы текущего запроса; gevent.local - свой у каждого гринлета (и потока)
+_request = local()
+
+
+def record_stage(stage, elapsed):
+    """Учитывает время этапа, замеренное вызывающим (например, сумму по многим коротким участкам), как timer."""
+    stage_seconds.observe(stage, elapsed)
+    timings = getattr(_request, 'timings', None)
+    if timings is not None:
+        timings.append((stage, elapsed))
+
+
+@contextmanager
+def timer(stage):
+    """Замер этапа: значение попадает в гистограмму и, если идет запрос, в разбивку его времени по этапам."""
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, perf_counter() - started)
+
+
+@contextmanager
+def collect_timings(timings):
+    """Этапы, замеренные внутри блока в текущем гринлете, добавляются в список timings.
+
+    Так собираются этапы задачи, выполняемой в отдельном гринлете, чтобы передать их ожидающим ее запросам
+    (см. extend_timings).
+    """
+    previous = getattr(_request, 'timings', None)
+    _request.timings = timings
+    try:
+        yield
+    finally:
+        _request.timings = previous
+
+
+def extend_timings(timings):
+    """Добавляет в разбивку времени текущего запроса этапы, замеренные в другом гринлете."""
+    current = getattr(_request, 'timings', None)
+    if current is not None:
+        current.extend(timings)
+
+
+def timed(stage):
+    """Декоратор: замер времени вызова функции как этапа stage."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(timings):
+    """Значение заголовка Server-Timing: этапы в порядке завершения, время в миллисекундах."""
+    return ', '.join('{};dur={:.3f}'.format(stage, elapsed * 1000) for stage, elapsed in timings)
+
+
+class StageTimingsPlugin:
+    """Плагин bottle: время запросов по маршрутам и разбивка времени запроса по этапам в заголовке Server-Timing.
+
+    Заголовок добавляется, если он включен (with_header) или запрос пришел с заголовком X-Debug-Timings.
+    """
+    name = 'stage_timings'
+    api = 2
+    DEBUG_HEADER = 'X-Debug-Timings'
+
+    def __init__(self, with_header=False):
+        self.with_header = with_header
+
+    def apply(self, callback, route):
+        @wraps(callback)
+        def wrapper(*args, **kwargs):
+            timings = _request.timings = []
+            started = perf_counter()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                request_seconds.observe(route.rule, perf_counter() - started)
+                _request.timings = None
+                if timings and (self.with_header or request.headers.get(self.DEBUG_HEADER)):
+                    response.set_header('Server-Timing', server_timing(timings))
+        return wrapper
+
+
+def metrics_view():
+    response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    return registry.expose()
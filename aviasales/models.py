@@ -1,16 +1,29 @@
+import heapq
 from abc import abstractmethod, ABC
-from collections import Iterable
+from collections.abc import Iterable
+from datetime import datetime
 from decimal import Decimal
+from functools import lru_cache
+from sys import intern
+from time import perf_counter
 
 from lxml import etree
 
+from .aggregation import GeneralInfoAccumulator
+from .columns import FlightsColumns, to_minor_units
 from .exceptions import FlightsNotFound
-from .settings import FLIGHTS_INFO_DIR_PATH
+from .indexes import FlightsIndex
+from .metrics import record_stage, timed, timer
+from .scoring import DEFAULT_WEIGHTS, scores as weighted_scores
+from .settings import FLIGHTS_INFO_DIR_PATH, OPTIMALITY_SCORES_CACHE_SIZE
 from .schemas import PricingSchema, RoutePartSchema
 
 
 class FlightsInfo:
     """Информация о перелетах (от партнера)."""
+    # параметры поиска, по которым выбирается файл с перелетами
+    SEARCH_FLAGS = ('one_way', 'with_child', 'with_infant')
+
     @staticmethod
     def is_round_trip_adult_flight(**params):
         """Является ли билетом в обе стороны только для взрослого пассажира."""
@@ -22,16 +35,31 @@ class FlightsInfo:
         return 'with_child' in params and 'with_infant' in params and 'one_way' in params
 
     @classmethod
-    def get_xml(cls, **params):
-        """Возвращает путь к xml файлу с информацией о перелетах."""
+    def get_xml_name(cls, **params):
+        """Возвращает имя xml файла с информацией о перелетах."""
         if cls.is_round_trip_adult_flight(**params):
-            return FLIGHTS_INFO_DIR_PATH + '/round_trip_adult.xml'
+            return 'round_trip_adult.xml'
 
         if cls.is_one_way_with_child_and_infant_flight(**params):
-            return FLIGHTS_INFO_DIR_PATH + '/one_way_with_child_and_infant.xml'
+            return 'one_way_with_child_and_infant.xml'
 
         raise FlightsNotFound
 
+    @classmethod
+    def normalize_params(cls, **params):
+        """Канонические параметры поиска, по которым get_xml выбирает тот же файл.
+
+        Значения флагов и параметры, не влияющие на выбор файла, отбрасываются. Если параметрам не соответствует
+        ни один файл, выбрасывается FlightsNotFound.
+        """
+        cls.get_xml_name(**params)
+        return {flag: '' for flag in cls.SEARCH_FLAGS if flag in params}
+
+    @classmethod
+    def get_xml(cls, **params):
+        """Возвращает путь к xml файлу с информацией о перелетах."""
+        return FLIGHTS_INFO_DIR_PATH + '/' + cls.get_xml_name(**params)
+
 
 class FlightsInfoXmlParser:
     tag_field_mapping = {
@@ -48,26 +76,56 @@ class FlightsInfoXmlParser:
         'SingleInfant': 'infant',
     }
 
+    # проверка значений схемами маршмэллоу; без нее значения преобразуются напрямую
+    strict = False
+    datetime_format = '%Y-%m-%dT%H%M'
+
+    @staticmethod
+    @lru_cache(maxsize=8192)
+    def _parse_datetime(value):
+        """Разбор времени; значения в ответах сильно повторяются, поэтому результат кэшируется."""
+        return datetime.strptime(value, FlightsInfoXmlParser.datetime_format)
+
+    @classmethod
+    def _load_route_part(cls, route_part_params):
+        if cls.strict:
+            return RoutePart(**RoutePartSchema().load(route_part_params))
+
+        route_part_params['departure_datetime'] = cls._parse_datetime(route_part_params['departure_datetime'])
+        route_part_params['arrival_datetime'] = cls._parse_datetime(route_part_params['arrival_datetime'])
+        return RoutePart(**route_part_params)
+
+    @classmethod
+    def _load_pricing(cls, pricing_params):
+        if cls.strict:
+            return Pricing(**PricingSchema().load(pricing_params))
+
+        for field_name in ('adult', 'child', 'infant'):
+            if field_name in pricing_params:
+                pricing_params[field_name] = Decimal(pricing_params[field_name])
+        return Pricing(**pricing_params)
+
     @classmethod
     def _route_parts(cls, route_info):
+        mapping = cls.tag_field_mapping
         for route_part in route_info:
             route_part_params = {}
             for detail in route_part:
-                field_name = cls.tag_field_mapping.get(detail.tag)
+                field_name = mapping.get(detail.tag)
                 if field_name:
                     route_part_params[field_name] = detail.text
-            yield RoutePart(**RoutePartSchema().load(route_part_params))
+            yield cls._load_route_part(route_part_params)
 
     @classmethod
-    def _get_route_from_xml_element(cls, xml_element, xpath):
-        route_parts_info = xml_element.xpath(xpath)
+    def _get_route_from_xml_element(cls, xml_element, path):
+        route_parts_info = xml_element.findall(path)
         if not route_parts_info:
             return None
         return Route(cls._route_parts(route_parts_info), with_validate=False)
 
     @classmethod
-    def _get_pricing_from_xml_element(cls, xml_element, xpath):
-        pricing_info = xml_element.xpath(xpath)[0]
+    def _get_pricing_from_xml_element(cls, xml_element, path):
+        pricing_info = xml_element.find(path)
         pricing_params = dict(currency=pricing_info.get('currency'))
 
         for price in pricing_info:
@@ -77,7 +135,7 @@ class FlightsInfoXmlParser:
                 field_name = cls.tag_field_mapping[p_type]
                 pricing_params[field_name] = price.text
 
-        return Pricing(**PricingSchema().load(pricing_params))
+        return cls._load_pricing(pricing_params)
 
     @classmethod
     def _get_flight_from_xml_element(cls, xml_element):
@@ -102,6 +160,10 @@ class FlightsInfoXmlParser:
             yield element
 
             element.clear()
+            # разобранные элементы остаются в дереве пустыми, на больших файлах они занимают заметную память
+            parent = element.getparent()
+            while element.getprevious() is not None:
+                del parent[0]
 
     @classmethod
     def flights(cls, path_to_file):
@@ -110,7 +172,14 @@ class FlightsInfoXmlParser:
             yield cls._get_flight_from_xml_element(element)
 
 
+class StrictFlightsInfoXmlParser(FlightsInfoXmlParser):
+    """Разбор с проверкой значений схемами маршмэллоу."""
+    strict = True
+
+
 class Collection(ABC):
+    __slots__ = ('_elements',)
+
     def __init__(self, elements, with_validate=True):
         assert isinstance(elements, Iterable), '{} elements must be iterable object'
         self._elements = list(elements)
@@ -142,10 +211,16 @@ class Collection(ABC):
                 '{} elements must be {} type'.format(self._class_name, self.element_type)
 
 
+def _intern(value):
+    return intern(value) if type(value) is str else value
+
+
 class Pricing:
     """Цены на билеты."""
+    __slots__ = ('currency', 'adult', 'child', 'infant')
+
     def __init__(self, currency, adult, child=None, infant=None):
-        self.currency = currency
+        self.currency = _intern(currency)
         self.adult = adult
         self.child = child
         self.infant = infant
@@ -157,30 +232,48 @@ class Pricing:
 
         return sum(to_float(field) for field in (self.adult, self.child, self.infant))
 
+    @property
+    def full_minor_units(self):
+        """Полная цена в минимальных единицах валюты (для сравнения и сортировки)."""
+        return to_minor_units(self.full)
+
 
 class RoutePart:
-    """Минимальная составная единица маршрута Route (перелет из source в destination)."""
+    """Минимальная составная единица маршрута Route (перелет из source в destination).
+
+    Коды перевозчиков, аэропортов, классов и типов билетов повторяются в каждом ответе тысячи раз, поэтому они
+    интернируются: все части маршрутов ссылаются на одну строку.
+    """
+    __slots__ = ('carrier', 'flight_number', 'source', 'destination', 'departure_datetime', 'arrival_datetime',
+                 'class_type', 'ticket_type')
+
     def __init__(self, carrier, flight_number,
                  source, destination,
                  departure_datetime, arrival_datetime,
                  class_type, ticket_type):
-        self.carrier = carrier
+        self.carrier = _intern(carrier)
         self.flight_number = flight_number
-        self.source = source
-        self.destination = destination
+        self.source = _intern(source)
+        self.destination = _intern(destination)
         self.departure_datetime = departure_datetime
         self.arrival_datetime = arrival_datetime
-        self.class_type = class_type
-        self.ticket_type = ticket_type
+        self.class_type = _intern(class_type)
+        self.ticket_type = _intern(ticket_type)
 
 
 class Route(Collection):
     """Маршрут целиком, хранящий части маршрута типа RoutePart."""
+    __slots__ = ()
     element_type = RoutePart
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.route = self._elements
+    def __init__(self, elements, with_validate=True):
+        super().__init__(elements, with_validate)
+        # части маршрута не меняются, кортеж меньше списка
+        self._elements = tuple(self._elements)
+
+    @property
+    def route(self):
+        return self._elements
 
     @property
     def n_transfers(self):
@@ -219,11 +312,16 @@ class Route(Collection):
 
     @property
     def carriers(self):
-        return {rp.carrier for rp in self}
+        return {rp.carrier for rp in self._elements}
+
+    @property
+    def key(self):
+        """Канонический ключ маршрута: перевозчики, номера рейсов и время каждой части."""
+        return tuple((rp.carrier, rp.flight_number, rp.departure_datetime, rp.arrival_datetime) for rp in self)
 
     @property
     def airports(self):
-        return {airport for rp in self for airport in (rp.source, rp.destination)}
+        return {airport for rp in self._elements for airport in (rp.source, rp.destination)}
 
 
 class NoRoute:
@@ -232,37 +330,56 @@ class NoRoute:
         return None
 
 
+# у заглушки нет состояния, она одна на все перелеты в одну сторону
+NO_ROUTE = NoRoute()
+
+# общие для всех перелетов кортежи кодов перевозчиков и аэропортов: различных наборов в ответах немного
+_shared_codes = {}
+MAX_SHARED_CODES = 100000
+
+
+def shared_codes(codes):
+    """Отсортированный кортеж кодов, один объект на все равные наборы."""
+    codes = tuple(sorted(codes))
+    if len(_shared_codes) >= MAX_SHARED_CODES:
+        _shared_codes.clear()
+    return _shared_codes.setdefault(codes, codes)
+
+
 class Flight:
-    """Информация о перелете."""
+    """Информация о перелете.
+
+    Перевозчики и аэропорты вычисляются при первом обращении и хранятся как общие для равных наборов кортежи.
+    """
+    __slots__ = ('pricing', 'onward_route', 'return_route', '_carriers', '_airports')
+
     def __init__(self, pricing, onward_route, return_route=None):
         self.pricing = pricing
         self.onward_route = onward_route
-        self.return_route = return_route or NoRoute()
+        self.return_route = return_route or NO_ROUTE
+        self._carriers = None
+        self._airports = None
 
     @property
     def price(self):
         return self.pricing.full
 
+    @property
+    def price_minor_units(self):
+        return self.pricing.full_minor_units
+
     @property
     def time(self):
         return self.onward_route.time + (self.return_route.time or 0)
 
-    def optimality(self, min_price, max_price, min_time, max_time):
-        """Оптимальность полета (чем меньше, тем лучше)."""
-        price = (self.price - min_price) / (max_price - min_price) if max_price != min_price else 1
-        time = (self.time - min_time) / (max_time - min_time) if max_time != min_time else 1
-
-        return Decimal(0.7) * price + Decimal(0.3 * time)
-
     @staticmethod
     def without_none(*iterable):
         return filter(lambda i: i is not None, iterable)
 
-    @staticmethod
-    def concat_to_unique_list(iterable_or_none1, iterable_or_none2):
-        res = set(iterable_or_none1 or [])
-        res.update(set(iterable_or_none2 or []))
-        return list(res)
+    @property
+    def key(self):
+        """Канонический ключ перелета для сопоставления одинаковых перелетов из разных ответов."""
+        return self.onward_route.key, self.return_route.key
 
     @property
     def n_transfers(self):
@@ -274,13 +391,22 @@ class Flight:
         """Максимальное время пересадки среди маршрутов туда и обратно."""
         return max(self.without_none(self.onward_route.transfer_time, self.return_route.transfer_time))
 
+    def _codes(self, field_name):
+        codes = getattr(self.onward_route, field_name)
+        return_codes = getattr(self.return_route, field_name)
+        return shared_codes(codes | return_codes if return_codes else codes)
+
     @property
     def carriers(self):
-        return self.concat_to_unique_list(self.onward_route.carriers, self.return_route.carriers)
+        if self._carriers is None:
+            self._carriers = self._codes('carriers')
+        return self._carriers
 
     @property
     def airports(self):
-        return self.concat_to_unique_list(self.onward_route.airports, self.return_route.airports)
+        if self._airports is None:
+            self._airports = self._codes('airports')
+        return self._airports
 
     @property
     def onward_dep_time(self):
@@ -303,42 +429,121 @@ class Flights(Collection):
     """Список перелетов Flight."""
     element_type = Flight
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def __init__(self, elements, with_validate=True):
+        self._init_columns(FlightsColumns(), GeneralInfoAccumulator())
+        super().__init__(self._collect(elements), with_validate=with_validate)
         self.flights = self._elements
-        self._calculate_general_info()
-
-    def _calculate_general_info(self):
-        self.general_info = dict()
-        self.general_info['quantity'] = len(self)
-
-        # да, это неоптимально по количеству проходов по Flights, но лень делать оптимально :)
-        for f_name in ('price', 'time', 'transfer_time', 'onward_dep_time', 'onward_arr_time',
-                       'return_dep_time', 'return_arr_time'):
-            self.general_info[f_name] = self._calculate_field_borders(f_name)
-
-        for f_name in ('airports', 'carriers'):
-            self.general_info[f_name] = list(set(elem for f in self for elem in getattr(f, f_name)))
 
-        f_name = 'n_transfers'
-        self.general_info[f_name] = list(set(getattr(f, f_name) for f in self))
+    def _init_columns(self, columns, info):
+        self.columns = columns
+        self.info = info
+        # колонки оптимальности по нормированным наборам весов, в порядке расчета
+        self._scores = {}
+        self._index = None
+        self._keys = None
+        # кэш готовых ответов по этим перелетам (см. responses.ResponseCache)
+        self.responses = None
+        # функция без аргументов, которую вызывает size_changed (например, пересчет размера записи в кэше задач)
+        self.on_size_change = None
+
+    def size_changed(self):
+        """Сообщает, что построены производные структуры (индексы, ключи, оценки, готовые ответы) и размер вырос."""
+        if self.on_size_change is not None:
+            self.on_size_change()
 
-    def _calculate_field_borders(self, field_name):
-        values = {getattr(f, field_name) for f in self}
-        if not values or None in values:
-            return None
-        return min(values), max(values)
+    @classmethod
+    def from_columns(cls, elements, columns):
+        """Перелеты с уже рассчитанными колонками columns (FlightsColumns).
+
+        elements - последовательность Flight, i-й элемент которой соответствует i-й строке колонок: список или,
+        например, последовательность, создающая объекты Flight только при обращении к ним.
+        """
+        flights = cls.__new__(cls)
+        with timer('general_info'):
+            flights._init_columns(columns, GeneralInfoAccumulator.from_columns(columns))
+            flights.general_info = flights.info.general_info
+        flights._elements = flights.flights = elements
+        return flights
+
+    def _collect(self, elements):
+        """Заполняет колонки и общую информацию в том же проходе, в котором перелеты получаются от парсера.
+
+        Время расчета общей информации (без разбора и заполнения колонок) замеряется как этап general_info.
+        """
+        assert isinstance(elements, Iterable), '{} elements must be iterable object'
+        elapsed = 0
+        for flight in elements:
+            row = self.columns.append(flight)
+            started = perf_counter()
+            self.info.add_row(row)
+            elapsed += perf_counter() - started
+            yield flight
+        started = perf_counter()
+        self.general_info = self.info.general_info
+        record_stage('general_info', elapsed + perf_counter() - started)
 
     @classmethod
     def from_flights_info(cls, flights_info, info_parser):
         return cls(info_parser.flights(flights_info), with_validate=False)
 
-    def top(self, field_name='price', number=10, reverse=False):
-        assert field_name in ('price', 'time', 'optimality')
+    def scores(self, weights=None):
+        """Колонка оптимальности перелетов с весами weights (scoring.Weights, по умолчанию - из настроек).
+
+        Колонка считается один раз для каждого набора весов и хранится вместе с перелетами; хранятся колонки
+        последних OPTIMALITY_SCORES_CACHE_SIZE наборов.
+        """
+        weights = (weights or DEFAULT_WEIGHTS).normalized()
+        column = self._scores.get(weights)
+        if column is None:
+            while len(self._scores) >= OPTIMALITY_SCORES_CACHE_SIZE:
+                del self._scores[next(iter(self._scores))]
+            column = self._scores[weights] = weighted_scores(self.columns, weights)
+            self.size_changed()
+        return column
 
+    @property
+    def optimality(self):
+        """Колонка оптимальности перелетов с весами по умолчанию (чем меньше, тем лучше)."""
+        return self.scores()
+
+    @property
+    def index(self):
+        """Индексы для фильтрации, строятся при первом обращении."""
+        if self._index is None:
+            self._index = FlightsIndex(self.columns)
+            self.size_changed()
+        return self._index
+
+    @property
+    def keys(self):
+        """Канонические ключи перелетов (Flight.key), вычисляются при первом обращении."""
+        if self._keys is None:
+            self._keys = [f.key for f in self]
+            self.size_changed()
+        return self._keys
+
+    def select(self, **filters):
+        """Номера перелетов, удовлетворяющих фильтрам (см. FlightsIndex.select)."""
+        return self.index.select(**filters)
+
+    def _key_column(self, field_name, weights=None):
         if field_name == 'optimality':
-            key = lambda f: f.optimality(*self.general_info['price'], *self.general_info['time'])
-        else:
-            key = lambda x: getattr(x, field_name)
+            return self.scores(weights)
+        return getattr(self.columns, field_name)
+
+    @timed('top')
+    def top(self, field_name='price', number=10, reverse=False, offset=0, rows=None, weights=None):
+        """Перелеты с наименьшими (наибольшими при reverse=True) значениями поля начиная с позиции offset.
+
+        Используется частичная выборка через кучу, а не полная сортировка. Порядок совпадает с
+        sorted(..., reverse=reverse)[offset:offset + number]. rows ограничивает выборку перелетами с этими номерами,
+        weights - веса оптимальности (см. scores).
+        """
+        assert field_name in ('price', 'time', 'optimality')
 
-        return sorted(self, key=key, reverse=reverse)[:number]
+        column = self._key_column(field_name, weights)
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        if rows is None:
+            rows = range(len(self))
+        indexes = select(offset + number, rows, key=column.__getitem__)[offset:]
+        return [self[i] for i in indexes]
@@ -0,0 +1,105 @@
+import mmap
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import gevent
+from lxml import etree
+
+from .settings import PARALLEL_PARSE_MIN_SIZE, PARSE_MODE, PARSE_PROCESSES
+
+FLIGHTS_TAG_RE = re.compile(rb'<(/?)Flights[\s>]')
+
+_executor = None
+
+
+def flight_element_ranges(buffer):
+    """Байтовые диапазоны элементов Flights верхнего уровня (дочерних для PricedItineraries)."""
+    level = 0
+    start = None
+    for match in FLIGHTS_TAG_RE.finditer(buffer):
+        if match.group(1):
+            level -= 1
+            if level == 0:
+                yield start, buffer.find(b'>', match.end() - 1) + 1
+        else:
+            if level == 0:
+                start = match.start()
+            level += 1
+
+
+def split_ranges(ranges, n_chunks):
+    """Объединяет подряд идущие диапазоны в n_chunks частей примерно одинакового размера."""
+    if not ranges:
+        return []
+    total = ranges[-1][1] - ranges[0][0]
+    chunk_size = max(total // n_chunks, 1)
+
+    chunks = []
+    chunk_start = None
+    for start, end in ranges:
+        if chunk_start is None:
+            chunk_start = start
+        if end - chunk_start >= chunk_size:
+            chunks.append((chunk_start, end))
+            chunk_start = None
+    if chunk_start is not None:
+        chunks.append((chunk_start, ranges[-1][1]))
+    return chunks
+
+
+def parse_range(parser, path_to_file, start, end):
+    """Разбор перелетов из байтового диапазона файла (выполняется в отдельном процессе)."""
+    with open(path_to_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    root = etree.fromstring(b'<PricedItineraries>' + data + b'</PricedItineraries>')
+    return [parser._get_flight_from_xml_element(element) for element in root]
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: процесс с gevent и потоками небезопасно форкать
+        _executor = ProcessPoolExecutor(PARSE_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def _wait(func, *args):
+    """Ожидание блокирующего вызова в пуле потоков gevent, не останавливающее цикл событий."""
+    return gevent.get_hub().threadpool.apply(func, args)
+
+
+def parse_in_processes(parser, path_to_file, n_chunks=None):
+    """Разбор файла частями в пуле процессов; порядок перелетов совпадает с последовательным разбором."""
+    with open(path_to_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        ranges = _wait(lambda: list(flight_element_ranges(buffer)))
+
+    executor = _get_executor()
+    chunks = split_ranges(ranges, n_chunks or PARSE_PROCESSES * 4)
+    futures = [executor.submit(parse_range, parser, path_to_file, start, end) for start, end in chunks]
+    for future in futures:
+        yield from _wait(future.result)
+
+
+def parse_in_threadpool(parser, path_to_file):
+    """Разбор файла в потоке пула gevent, чтобы не блокировать остальные гринлеты."""
+    yield from _wait(lambda: list(parser.flights(path_to_file)))
+
+
+def parse_flights(parser, path_to_file, mode=None):
+    """Перелеты из файла с ответом партнера.
+
+    Режимы: 'inline' - в текущем гринлете, 'threadpool' - в пуле потоков gevent, 'processes' - частями в пуле
+    процессов (для файлов не меньше PARALLEL_PARSE_MIN_SIZE, меньшие разбираются в пуле потоков).
+    """
+    mode = mode or PARSE_MODE
+    if mode == 'processes' and os.path.getsize(path_to_file) < PARALLEL_PARSE_MIN_SIZE:
+        mode = 'threadpool'
+
+    if mode == 'processes':
+        return parse_in_processes(parser, path_to_file)
+    if mode == 'threadpool':
+        return parse_in_threadpool(parser, path_to_file)
+    return parser.flights(path_to_file)
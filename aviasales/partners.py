@@ -0,0 +1,114 @@
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from os.path import join
+from time import monotonic
+
+import gevent
+
+from .exceptions import FlightsNotFound
+from .models import FlightsInfo, Flights
+from .settings import FAN_OUT_DEADLINE, PARTNERS
+from .task import task, t_cached
+from .tasks import load_flights, search_key
+
+PartnerReport = namedtuple('PartnerReport', ('name', 'status', 'time', 'quantity'))
+
+
+class Partner(ABC):
+    """Партнер, у которого ищутся перелеты."""
+    def __init__(self, name):
+        self.name = name
+
+    @abstractmethod
+    def flights(self, **params):
+        """Перелеты (Flights) по параметрам поиска."""
+
+    def normalize_params(self, **params):
+        """Канонические параметры поиска (для ключа кэша): запросы с одинаковым результатом должны совпадать."""
+        return params
+
+
+class XmlPartner(Partner):
+    """Партнер, ответы которого лежат xml файлами в каталоге (имена файлов - как у FlightsInfo)."""
+    def __init__(self, name, dir_path):
+        super().__init__(name)
+        self.dir_path = dir_path
+
+    def flights(self, **params):
+        return load_flights(join(self.dir_path, FlightsInfo.get_xml_name(**params)))
+
+    def normalize_params(self, **params):
+        return FlightsInfo.normalize_params(**params)
+
+
+partners = [XmlPartner(name, dir_path) for name, dir_path in PARTNERS.items()]
+
+
+@t_cached(key=search_key(lambda partner, **params: partner.normalize_params(**params)))
+@task()
+def get_partner_flights_task(partner, **params):
+    return partner.flights(**params)
+
+
+def merge_flights(flights_lists):
+    """Объединяет перелеты разных партнеров; из одинаковых (по Flight.key) остается самый дешевый."""
+    merged = []
+    # цены объединенных перелетов в минимальных единицах валюты
+    prices = []
+    positions = {}
+    for flights in flights_lists:
+        for flight, key, price in zip(flights, flights.keys, flights.columns.price):
+            position = positions.get(key)
+            if position is None:
+                positions[key] = len(merged)
+                merged.append(flight)
+                prices.append(price)
+            elif price < prices[position]:
+                merged[position] = flight
+                prices[position] = price
+    return Flights(merged, with_validate=False)
+
+
+class FanOutSearch:
+    """Поиск сразу у нескольких партнеров с общим ограничением времени.
+
+    Для каждого партнера запускается своя задача (результаты кэшируются по партнеру и параметрам поиска).
+    По истечении deadline возвращаются перелеты партнеров, успевших ответить; задачи остальных продолжают
+    выполняться и попадут в кэш для следующих поисков.
+    """
+    def __init__(self, partners, deadline=FAN_OUT_DEADLINE):
+        self.partners = partners
+        self.deadline = deadline
+
+    def search(self, deadline=None, **params):
+        """Возвращает объединенные перелеты и список PartnerReport в порядке партнеров."""
+        deadline = self.deadline if deadline is None else min(deadline, self.deadline)
+        started = monotonic()
+        results = {}
+        reports = {}
+
+        def wait(partner, t):
+            try:
+                results[partner.name] = t.result
+                status = 'ok'
+            except FlightsNotFound:
+                status = 'not_found'
+            except Exception:
+                status = 'error'
+            quantity = len(results[partner.name]) if partner.name in results else 0
+            reports[partner.name] = PartnerReport(partner.name, status, monotonic() - started, quantity)
+
+        tasks = [(partner, get_partner_flights_task(partner, **params)) for partner in self.partners]
+        waiters = [gevent.spawn(wait, partner, t) for partner, t in tasks]
+        gevent.joinall(waiters, timeout=deadline)
+        gevent.killall(waiters)
+
+        elapsed = monotonic() - started
+        reports = [reports.get(p.name) or PartnerReport(p.name, 'timeout', elapsed, 0) for p in self.partners]
+        if all(report.status == 'not_found' for report in reports):
+            raise FlightsNotFound
+        flights = merge_flights(results[p.name] for p in self.partners if p.name in results)
+        return flights, reports
+
+
+fan_out_search = FanOutSearch(partners)
@@ -0,0 +1,107 @@
+import cProfile
+import os
+import re
+from datetime import datetime
+from functools import wraps
+from glob import glob
+from ipaddress import ip_address, ip_network
+from time import monotonic
+
+from bottle import request, response
+
+from .settings import PROFILES_DIR_PATH, PROFILING_MAX_FILES, PROFILING_MIN_INTERVAL, PROFILING_TRUSTED_NETWORKS
+
+
+class ProfilingPlugin:
+    """Плагин bottle: профилирование отдельных запросов cProfile по требованию.
+
+    Профиль снимается, если запрос с доверенного адреса пришел с заголовком X-Profile или параметром profile и с
+    начала предыдущего профилирования прошло не меньше min_interval секунд; одновременно профилируется только один
+    запрос. cProfile работает на уровне потока, поэтому в профиль попадают и гринлеты задач, которых ждет запрос
+    (разбор ответа в get_flights_task), а при одновременных запросах - и их гринлеты. Разбор в пуле потоков или
+    процессов в профиль не попадает.
+
+    Профили сохраняются в dir_path в формате pstats (python -m pstats, snakeviz), хранятся последние max_files.
+    Имя файла профиля возвращается в заголовке ответа X-Profile.
+    """
+    name = 'profiling'
+    api = 2
+    HEADER = 'X-Profile'
+    PARAM = 'profile'
+    SUFFIX = '.prof'
+
+    def __init__(self, dir_path=PROFILES_DIR_PATH, trusted_networks=PROFILING_TRUSTED_NETWORKS,
+                 min_interval=PROFILING_MIN_INTERVAL, max_files=PROFILING_MAX_FILES):
+        self.dir_path = dir_path
+        self.trusted_networks = [ip_network(network) for network in trusted_networks]
+        self.min_interval = min_interval
+        self.max_files = max_files
+        self._last_started = None
+        self._active = False
+
+    def is_trusted(self):
+        # только адрес соединения: X-Forwarded-For клиент может подделать
+        try:
+            address = ip_address(request.environ.get('REMOTE_ADDR') or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_networks)
+
+    def is_requested(self):
+        return bool(request.headers.get(self.HEADER) or self.PARAM in request.query)
+
+    def _acquire(self):
+        now = monotonic()
+        if self._active or (self._last_started is not None and now - self._last_started < self.min_interval):
+            return False
+        self._active = True
+        self._last_started = now
+        return True
+
+    def _path(self, route):
+        route_name = re.sub(r'\W+', '_', route.rule).strip('_') or 'root'
+        file_name = '{}-{}-{}{}'.format(datetime.now().strftime('%Y%m%dT%H%M%S%f'), route_name, os.getpid(),
+                                        self.SUFFIX)
+        return os.path.join(self.dir_path, file_name)
+
+    def _remove_old_profiles(self):
+        paths = sorted(glob(os.path.join(self.dir_path, '*' + self.SUFFIX)))
+        for path in paths[:max(len(paths) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _save(self, profile, route):
+        os.makedirs(self.dir_path, exist_ok=True)
+        path = self._path(route)
+        profile.dump_stats(path)
+        self._remove_old_profiles()
+        return path
+
+    def apply(self, callback, route):
+        @wraps(callback)
+        def wrapper(*args, **kwargs):
+            if not (self.is_requested() and self.is_trusted()):
+                return callback(*args, **kwargs)
+            if not self._acquire():
+                response.set_header(self.HEADER, 'rate-limited')
+                return callback(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            try:
+                try:
+                    profile.enable()
+                except ValueError:
+                    # уже работает другой профилировщик
+                    response.set_header(self.HEADER, 'unavailable')
+                    return callback(*args, **kwargs)
+                try:
+                    return callback(*args, **kwargs)
+                finally:
+                    profile.disable()
+                    path = self._save(profile, route)
+                    response.set_header(self.HEADER, os.path.basename(path))
+            finally:
+                self._active = False
+        return wrapper
@@ -0,0 +1,66 @@
+from collections import namedtuple
+from hashlib import md5
+
+from bottle import HTTPResponse, request, response
+from cachetools import LRUCache
+
+from .settings import RESPONSE_CACHE_MAX_BYTES
+
+CachedResponse = namedtuple('CachedResponse', ('body', 'etag'))
+
+
+def response_size(cached_response):
+    return len(cached_response.body)
+
+
+class ResponseCache:
+    """Кэш готовых к отправке JSON-ответов.
+
+    Ответы хранятся в самом объекте Flights (Flights.responses) и удаляются вместе с ним, поэтому живут ровно
+    столько, сколько запись task_cache с этими перелетами, и учитываются в ее размере: после добавления ответа
+    размер записи пересчитывается (Flights.size_changed). Объем ответов одного Flights ограничен max_bytes, давно
+    не запрошенные ответы вытесняются.
+    """
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+
+    def _flights_cache(self, flights):
+        if flights.responses is None:
+            flights.responses = LRUCache(maxsize=self.max_bytes, getsizeof=response_size)
+        return flights.responses
+
+    def get(self, flights, key, make_json):
+        """Возвращает CachedResponse, при отсутствии в кэше строит его из JSON-строки make_json()."""
+        cache = self._flights_cache(flights)
+        cached_response = cache.get(key)
+        if cached_response is None:
+            body = make_json().encode()
+            cached_response = CachedResponse(body, '"{}"'.format(md5(body).hexdigest()))
+            try:
+                cache[key] = cached_response
+            except ValueError:
+                # ответ больше всего кэша
+                return cached_response
+            flights.size_changed()
+        return cached_response
+
+
+response_cache = ResponseCache()
+
+
+def etag_matches(etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    etags = {tag.strip() for tag in if_none_match.split(',')}
+    return '*' in etags or etag in etags or 'W/' + etag in etags
+
+
+def json_response(cached_response):
+    """Отдает закэшированный ответ, либо 304, если у клиента уже есть актуальная версия."""
+    if etag_matches(cached_response.etag):
+        return HTTPResponse(status=304, ETag=cached_response.etag)
+
+    response.content_type = 'application/json'
+    response.set_header('ETag', cached_response.etag)
+    return cached_response.body
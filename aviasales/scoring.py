@@ -0,0 +1,65 @@
+from array import array
+from collections import namedtuple
+
+from .settings import OPTIMALITY_WEIGHTS
+
+
+class Weights(namedtuple('Weights', ('price', 'time', 'n_transfers', 'transfer_time'))):
+    """Веса полей в оптимальности перелета (чем меньше оптимальность, тем лучше перелет).
+
+    Значение каждого поля нормируется по границам колонки в [0, 1] и умножается на вес; если все значения поля
+    равны, его вклад равен весу. Время пересадки - максимальное для перелета.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, weights):
+        """Веса по словарю; не заданные веса берутся из DEFAULT_WEIGHTS."""
+        return DEFAULT_WEIGHTS._replace(**weights)
+
+    def normalized(self):
+        """Веса с суммой 1: пропорциональные наборы весов упорядочивают перелеты одинаково."""
+        total = sum(self)
+        if not total:
+            return self
+        return Weights(*(weight / total for weight in self))
+
+
+DEFAULT_WEIGHTS = Weights(**OPTIMALITY_WEIGHTS)
+
+
+def linear_terms(columns, weights):
+    """Оптимальность в виде линейной формы sum(k * column) + c по колонкам FlightsColumns.
+
+    Нормировка по границам колонок переносится в коэффициенты k и c, поэтому при расчете не нужны ни
+    нормированные копии колонок, ни деление на каждом значении. Возвращает ([(k, колонка)], c).
+    """
+    terms = []
+    constant = 0.0
+    for field_name, weight in zip(Weights._fields, weights):
+        if not weight:
+            continue
+        column = getattr(columns, field_name)
+        low, high = columns.borders(field_name)
+        if high != low:
+            coefficient = weight / (high - low)
+            terms.append((coefficient, column))
+            constant -= coefficient * low
+        else:
+            constant += weight
+    return terms, constant
+
+
+def scores(columns, weights=DEFAULT_WEIGHTS):
+    """Колонка оптимальности всех перелетов, рассчитанная за один проход по колонкам каждого поля."""
+    if not len(columns):
+        return array('d')
+    terms, constant = linear_terms(columns, weights)
+    if not terms:
+        return array('d', [constant]) * len(columns)
+
+    (coefficient, column), *terms = terms
+    values = [coefficient * value + constant for value in column]
+    for coefficient, column in terms:
+        values = [score + coefficient * value for score, value in zip(values, column)]
+    return array('d', values)
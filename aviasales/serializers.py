@@ -0,0 +1,145 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+import simplejson
+
+from .metrics import timed
+from .models import NoRoute
+from .schemas import FlightSchema, FlightsGeneralInfoSchema, FlightsSchema
+from .settings import SERIALIZER
+
+ROUTE_PART_DATETIME_FORMAT = '%Y-%m-%dT%H%M'
+# так маршмэллоу сериализует отсутствующий обратный маршрут NoRoute
+NO_ROUTE = [{'carrier': None, 'flight_number': None, 'source': None,
+             'departure_datetime': None, 'arrival_datetime': None, 'destination': None,
+             'class_type': None, 'ticket_type': None}]
+
+
+class FlightsSerializer(ABC):
+    """Сериализатор перелетов в структуры схем FlightsSchema и FlightsGeneralInfoSchema."""
+    @abstractmethod
+    def flight(self, flight):
+        pass
+
+    def flights(self, flights):
+        return {'flights': [self.flight(f) for f in flights]}
+
+    @abstractmethod
+    def general_info(self, general_info):
+        pass
+
+    def iter_json(self, flights):
+        """JSON перелетов частями (по перелету), flights может быть генератором."""
+        yield '{"flights": ['
+        dumps = simplejson.dumps
+        for i, flight in enumerate(flights):
+            yield (', ' if i else '') + dumps(self.flight(flight))
+        yield ']}'
+
+    def iter_ndjson(self, flights):
+        """Перелеты в формате NDJSON, по строке на перелет."""
+        dumps = simplejson.dumps
+        for flight in flights:
+            yield dumps(self.flight(flight)) + '\n'
+
+    @timed('dump')
+    def dumps(self, flights):
+        return ''.join(self.iter_json(flights))
+
+    @timed('dump')
+    def dumps_general_info(self, general_info):
+        return simplejson.dumps(self.general_info(general_info))
+
+
+class MarshmallowFlightsSerializer(FlightsSerializer):
+    def flight(self, flight):
+        return FlightSchema().dump(flight)
+
+    def flights(self, flights):
+        return FlightsSchema().dump({'flights': flights})
+
+    def general_info(self, general_info):
+        return FlightsGeneralInfoSchema().dump(general_info)
+
+
+@lru_cache(maxsize=4096)
+def _route_part_datetime(value):
+    return value.strftime(ROUTE_PART_DATETIME_FORMAT)
+
+
+@lru_cache(maxsize=4096)
+def _isoformat(value):
+    if value is None:
+        return None
+    # наивное время считается UTC, как в marshmallow
+    return value.isoformat() + '+00:00'
+
+
+def _isoformat_borders(borders):
+    if borders is None:
+        return None
+    return [_isoformat(value) for value in borders]
+
+
+class FastFlightsSerializer(FlightsSerializer):
+    """Сериализация без маршмэллоу.
+
+    Структура и порядок полей повторяют FlightsSchema, результат после simplejson.dumps совпадает побайтово.
+    """
+    @staticmethod
+    def _route(route):
+        if route is None:
+            return None
+        if isinstance(route, NoRoute):
+            return NO_ROUTE
+        return [{
+            'carrier': rp.carrier,
+            'flight_number': rp.flight_number,
+            'source': rp.source,
+            'departure_datetime': _route_part_datetime(rp.departure_datetime),
+            'arrival_datetime': _route_part_datetime(rp.arrival_datetime),
+            'destination': rp.destination,
+            'class_type': rp.class_type,
+            'ticket_type': rp.ticket_type,
+        } for rp in route]
+
+    def flight(self, flight):
+        pricing = flight.pricing
+        return {
+            'pricing': {
+                'currency': pricing.currency,
+                'adult': pricing.adult,
+                'child': pricing.child,
+                'infant': pricing.infant,
+            },
+            'onward_route': self._route(flight.onward_route),
+            'return_route': self._route(flight.return_route),
+            'n_transfers': flight.n_transfers,
+            'onward_dep_time': _isoformat(flight.onward_dep_time),
+            'onward_arr_time': _isoformat(flight.onward_arr_time),
+            'return_dep_time': _isoformat(flight.return_dep_time),
+            'return_arr_time': _isoformat(flight.return_arr_time),
+            'transfer_time': flight.transfer_time,
+            'airports': flight.airports,
+            'carriers': flight.carriers,
+            'price': flight.price,
+        }
+
+    def general_info(self, general_info):
+        data = dict(general_info)
+        for f_name in ('onward_dep_time', 'onward_arr_time', 'return_dep_time', 'return_arr_time'):
+            data[f_name] = _isoformat_borders(data[f_name])
+        for f_name in ('price', 'time', 'transfer_time'):
+            data[f_name] = list(data[f_name]) if data[f_name] is not None else None
+        return data
+
+
+serializers = {
+    'fast': FastFlightsSerializer(),
+    'marshmallow': MarshmallowFlightsSerializer(),
+}
+
+
+def get_serializer(name=None):
+    """Сериализатор по имени, по умолчанию - заданный в настройках SERIALIZER."""
+    return serializers[name or SERIALIZER]
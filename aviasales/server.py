@@ -0,0 +1,128 @@
+"""Боевой сервер: gevent WSGIServer в одном или нескольких предварительно запущенных (pre-fork) процессах.
+
+Запуск: ``python -m aviasales.server [--workers N] [--port 8080] [--backlog 1024] [--keepalive 5]``.
+"""
+from gevent import monkey
+
+# патчить нужно до импорта всего остального, иначе модули получат блокирующие socket, threading и т.д.
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import signal  # noqa: E402
+import socket  # noqa: E402
+import sys  # noqa: E402
+
+import gevent  # noqa: E402
+from gevent.pywsgi import WSGIHandler, WSGIServer  # noqa: E402
+
+from .settings import SERVER_BACKLOG, SERVER_HOST, SERVER_KEEPALIVE, SERVER_PORT, SERVER_WORKERS  # noqa: E402
+
+
+class KeepAliveHandler(WSGIHandler):
+    """Обработчик соединения с ограничением времени простоя keep-alive соединения."""
+    keepalive = SERVER_KEEPALIVE
+
+    def read_requestline(self):
+        if not self.keepalive:
+            return super().read_requestline()
+        # таймаут действует только на ожидание следующего запроса: по его истечении чтение падает и соединение
+        # закрывается; тело запроса и ответ медленный клиент может передавать сколько угодно долго
+        self.socket.settimeout(self.keepalive)
+        try:
+            return super().read_requestline()
+        finally:
+            self.socket.settimeout(None)
+
+    def read_request(self, raw_requestline):
+        result = super().read_request(raw_requestline)
+        if not self.keepalive:
+            self.close_connection = True
+        return result
+
+
+def make_server(listener, keepalive=SERVER_KEEPALIVE, access_log=False):
+    from .wsgi import app
+
+    handler_class = type('KeepAliveHandler', (KeepAliveHandler,), {'keepalive': keepalive})
+    return WSGIServer(listener, app, handler_class=handler_class, log='default' if access_log else None)
+
+
+def serve_worker(listener, keepalive, access_log):
+    server = make_server(listener, keepalive, access_log)
+    gevent.signal_handler(signal.SIGTERM, server.stop)
+    server.serve_forever()
+
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, backlog=SERVER_BACKLOG,
+          keepalive=SERVER_KEEPALIVE, access_log=False):
+    """Запускает сервер.
+
+    Сокет открывается один раз в главном процессе, воркеры наследуют его и принимают соединения сами. Упавший
+    воркер перезапускается, SIGTERM/SIGINT останавливают все воркеры.
+    """
+    listener = WSGIServer.get_listener((host, port), backlog=backlog, family=socket.AF_INET)
+    if workers <= 1:
+        return serve_worker(listener, keepalive, access_log)
+
+    children = set()
+    stopping = False
+    # обработчики сигналов главного процесса; воркеры наследуют их при fork и должны сразу отменить
+    master_handlers = []
+
+    def start_worker():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                for handler in master_handlers:
+                    handler.cancel()
+                # SIGINT от терминала приходит всей группе процессов, воркеры останавливает главный процесс
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                serve_worker(listener, keepalive, access_log)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                # воркер уже завершился
+                children.discard(pid)
+
+    for _ in range(workers):
+        start_worker()
+    master_handlers.append(gevent.signal_handler(signal.SIGTERM, stop))
+    master_handlers.append(gevent.signal_handler(signal.SIGINT, stop))
+    print('Serving on {}:{} with {} workers'.format(host, port, workers), file=sys.stderr)
+
+    while children:
+        try:
+            pid, _ = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        if pid not in children:
+            continue
+        children.discard(pid)
+        if not stopping:
+            start_worker()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--host', default=SERVER_HOST)
+    arg_parser.add_argument('--port', type=int, default=SERVER_PORT)
+    arg_parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='число процессов')
+    arg_parser.add_argument('--backlog', type=int, default=SERVER_BACKLOG, help='очередь входящих соединений')
+    arg_parser.add_argument('--keepalive', type=float, default=SERVER_KEEPALIVE,
+                            help='время простоя keep-alive соединения, с (0 - без keep-alive)')
+    arg_parser.add_argument('--access-log', action='store_true', help='писать журнал запросов в stderr')
+    args = arg_parser.parse_args()
+    serve(args.host, args.port, args.workers, args.backlog, args.keepalive, args.access_log)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,67 @@
+from os import cpu_count
 from os.path import join, abspath, dirname
 
 
 FLIGHTS_INFO_DIR_PATH = abspath(join(dirname(__file__), '..', 'responses'))
+
+# сериализатор перелетов: 'fast' или 'marshmallow'
+SERIALIZER = 'fast'
+
+# дисковый кэш разобранных ответов партнеров (None - не использовать)
+FLIGHTS_CACHE_DIR_PATH = abspath(join(dirname(__file__), '..', 'responses_cache'))
+
+# проверять значения в ответах партнеров схемами маршмэллоу (медленнее)
+STRICT_PARSING = False
+
+# режим разбора ответов партнеров: 'inline', 'threadpool' или 'processes' (см. parsing.parse_flights)
+PARSE_MODE = 'inline'
+PARSE_PROCESSES = cpu_count() or 1
+# файлы меньшего размера не делятся между процессами
+PARALLEL_PARSE_MIN_SIZE = 4 * 1024 * 1024
+
+# партнеры для поиска по нескольким партнерам: имя -> каталог с xml ответами
+PARTNERS = {
+    'default': FLIGHTS_INFO_DIR_PATH,
+}
+# общее время ожидания ответов партнеров в секундах
+FAN_OUT_DEADLINE = 3
+
+# веса полей в оптимальности перелета по умолчанию (запрос /optimal может задать свои, см. scoring.Weights) и
+# число наборов весов, для которых оценки перелетов хранятся вместе с результатом поиска
+OPTIMALITY_WEIGHTS = {'price': 0.7, 'time': 0.3, 'n_transfers': 0, 'transfer_time': 0}
+OPTIMALITY_SCORES_CACHE_SIZE = 8
+
+# кэш задач: размер и время жизни записей в секундах. После TASK_CACHE_SOFT_TTL отдается устаревший результат и
+# запускается его фоновое обновление, после TASK_CACHE_TTL запрос ждет новый результат.
+TASK_CACHE_SIZE = 100
+# ограничение оценочного объема результатов в кэше задач на процесс вместе с построенными по ним индексами,
+# ключами, оценками и готовыми ответами, байт (оценка может быть завышена до ~25%, см. cache.estimated_size);
+# 'lru' или 'lfu' - порядок вытеснения
+TASK_CACHE_MAX_BYTES = 256 * 1024 * 1024
+TASK_CACHE_EVICTION = 'lru'
+TASK_CACHE_TTL = 300
+TASK_CACHE_SOFT_TTL = 240
+# объем готовых JSON-ответов, хранимых вместе с одним результатом поиска, байт (входит в TASK_CACHE_MAX_BYTES)
+RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# максимальное число одновременных фоновых обновлений
+TASK_CACHE_MAX_REFRESHES = 4
+
+# боевой сервер (python -m aviasales.server): число воркеров (процессов), очередь входящих соединений и время
+# ожидания следующего запроса в keep-alive соединении в секундах (0 - закрывать соединение после ответа)
+SERVER_HOST = '0.0.0.0'
+SERVER_PORT = 8080
+SERVER_WORKERS = cpu_count() or 1
+SERVER_BACKLOG = 1024
+SERVER_KEEPALIVE = 5
+
+# добавлять ко всем ответам API заголовок Server-Timing с разбивкой времени по этапам (без этой настройки - только
+# к запросам с заголовком X-Debug-Timings)
+STAGE_TIMINGS_HEADER = False
+
+# профилирование запросов по требованию (заголовок X-Profile или параметр profile, см. profiling.ProfilingPlugin):
+# каталог для профилей, сколько последних профилей хранить, адреса, с которых его можно включить, и минимальный
+# интервал между профилями в секундах
+PROFILES_DIR_PATH = abspath(join(dirname(__file__), '..', 'profiles'))
+PROFILING_MAX_FILES = 50
+PROFILING_TRUSTED_NETWORKS = ('127.0.0.1/32', '::1/128')
+PROFILING_MIN_INTERVAL = 60
@@ -0,0 +1,351 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Sequence
+from contextlib import contextmanager, nullcontext
+from decimal import Decimal
+from hashlib import md5
+from itertools import accumulate
+
+import gevent
+
+from .columns import CodeTable, FlightsColumns, from_timestamp, to_timestamp
+from .models import Flight, Flights, Pricing, Route, RoutePart
+
+logger = logging.getLogger(__name__)
+
+NONE_ID = 0xFFFFFFFF
+
+
+class StoredFlights(Sequence):
+    """Перелеты записи хранилища: объекты Flight создаются из колонок записи только при обращении к ним.
+
+    Строки, даты и цены, общие для многих перелетов, создаются один раз.
+    """
+    part_str_fields = ('carrier', 'flight_number', 'source', 'destination', 'class_type', 'ticket_type')
+
+    def __init__(self, strings, parts, columns):
+        self.strings = strings
+        self.parts = parts
+        self.columns = columns
+        self._datetimes = {}
+        self._decimals = {}
+
+    def __len__(self):
+        return len(self.columns['adult'])
+
+    def __getitem__(self, ind):
+        if isinstance(ind, slice):
+            return [self[i] for i in range(*ind.indices(len(self)))]
+        if ind < 0:
+            ind += len(self)
+        if not 0 <= ind < len(self):
+            raise IndexError('flight index out of range')
+
+        columns = self.columns
+        pricing = Pricing(self.strings[columns['currency'][ind]], self._decimal(columns['adult'][ind]),
+                          self._decimal(columns['child'][ind]), self._decimal(columns['infant'][ind]))
+        return Flight(pricing,
+                      self._route(columns['onward_start'][ind], columns['onward_len'][ind]),
+                      self._route(columns['return_start'][ind], columns['return_len'][ind]))
+
+    def _datetime(self, ts):
+        dt = self._datetimes.get(ts)
+        if dt is None:
+            dt = self._datetimes[ts] = from_timestamp(ts)
+        return dt
+
+    def _decimal(self, s_id):
+        if s_id == NONE_ID:
+            return None
+        value = self._decimals.get(s_id)
+        if value is None:
+            value = self._decimals[s_id] = Decimal(self.strings[s_id])
+        return value
+
+    def _route(self, start, length):
+        if not length:
+            return None
+        parts, strings = self.parts, self.strings
+        return Route((
+            RoutePart(*(strings[parts[f_name][i]] for f_name in self.part_str_fields[:4]),
+                      self._datetime(parts['departure_datetime'][i]), self._datetime(parts['arrival_datetime'][i]),
+                      strings[parts['class_type'][i]], strings[parts['ticket_type'][i]])
+            for i in range(start, start + length)
+        ), with_validate=False)
+
+
+class StringTable:
+    """Строки записи хранилища, декодируются при первом обращении."""
+    def __init__(self, data, ends):
+        self.data = data
+        self.ends = ends
+        self._strings = {}
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, s_id):
+        if s_id == NONE_ID:
+            return None
+        value = self._strings.get(s_id)
+        if value is None:
+            start = self.ends[s_id - 1] if s_id else 0
+            value = self._strings[s_id] = self.data[start:self.ends[s_id]].decode()
+        return value
+
+
+class FlightsCodec:
+    """Компактный бинарный колоночный формат для разобранного списка перелетов.
+
+    Структура файла: заголовок, таблица строк (все строковые значения и цены хранятся один раз), число элементов
+    каждой колонки и сами колонки: части маршрутов, перелеты, колонки FlightsColumns и таблицы кодов перевозчиков и
+    аэропортов. Колонки - массивы фиксированного размера, при загрузке они копируются из memory-mapped файла
+    целиком, а колонки и общая информация Flights восстанавливаются без создания объектов перелетов (см.
+    StoredFlights). Содержимое после заголовка проверяется по контрольной сумме, поэтому обрезанный или
+    поврежденный файл не загружается (loads выбрасывает ValueError).
+    """
+    MAGIC = b'AVFL'
+    VERSION = 3
+    # magic, версия, mtime_ns и размер исходного файла, число строк, crc32 содержимого
+    HEADER = struct.Struct('<4sHQQII')
+
+    part_str_fields = StoredFlights.part_str_fields
+    pricing_str_fields = ('currency', 'adult', 'child', 'infant')
+    # (имя колонки, typecode)
+    part_columns = tuple((f_name, 'I') for f_name in part_str_fields) + \
+        (('departure_datetime', 'q'), ('arrival_datetime', 'q'))
+    flight_columns = tuple((f_name, 'I') for f_name in pricing_str_fields) + \
+        (('onward_start', 'I'), ('onward_len', 'I'), ('return_start', 'I'), ('return_len', 'I'))
+    flights_columns = tuple((f_name, getattr(FlightsColumns(), f_name).typecode)
+                            for f_name in FlightsColumns.array_fields)
+    # строки кодов перевозчиков и аэропортов в порядке их номеров в FlightsColumns
+    code_columns = (('carrier_codes', 'I'), ('airport_codes', 'I'))
+    all_columns = part_columns + flight_columns + flights_columns + code_columns
+
+    @classmethod
+    def dumps(cls, flights, source_mtime_ns=0, source_size=0):
+        strings = {}
+
+        def string_id(value):
+            if value is None:
+                return NONE_ID
+            value = str(value)
+            s_id = strings.get(value)
+            if s_id is None:
+                s_id = strings[value] = len(strings)
+            return s_id
+
+        parts = {f_name: array(typecode) for f_name, typecode in cls.part_columns}
+        columns = {f_name: array(typecode) for f_name, typecode in cls.flight_columns}
+
+        def add_route(route, prefix):
+            columns[prefix + '_start'].append(len(parts['carrier']))
+            columns[prefix + '_len'].append(len(route) if isinstance(route, Route) else 0)
+            if not isinstance(route, Route):
+                return
+            for rp in route:
+                for f_name in cls.part_str_fields:
+                    parts[f_name].append(string_id(getattr(rp, f_name)))
+                parts['departure_datetime'].append(to_timestamp(rp.departure_datetime))
+                parts['arrival_datetime'].append(to_timestamp(rp.arrival_datetime))
+
+        for flight in flights:
+            for f_name in cls.pricing_str_fields:
+                columns[f_name].append(string_id(getattr(flight.pricing, f_name)))
+            add_route(flight.onward_route, 'onward')
+            add_route(flight.return_route, 'return')
+
+        flights_columns = flights.columns
+        columns.update((f_name, getattr(flights_columns, f_name)) for f_name in FlightsColumns.array_fields)
+        columns['carrier_codes'] = array('I', map(string_id, flights_columns.carriers))
+        columns['airport_codes'] = array('I', map(string_id, flights_columns.airports))
+        columns.update(parts)
+
+        encoded = [s.encode() for s in strings]
+        chunks = [
+            array('I', (len(s) for s in encoded)).tobytes(),
+            b''.join(encoded),
+            array('Q', (len(columns[f_name]) for f_name, _ in cls.all_columns)).tobytes(),
+        ]
+        for f_name, _ in cls.all_columns:
+            chunks.append(columns[f_name].tobytes())
+        body = b''.join(chunks)
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, source_mtime_ns, source_size, len(encoded), zlib.crc32(body))
+        return header + body
+
+    @classmethod
+    def header(cls, buffer):
+        """(mtime_ns, размер исходного файла, число строк, crc32) или None."""
+        if len(buffer) < cls.HEADER.size:
+            return None
+        magic, version, *header = cls.HEADER.unpack_from(buffer)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            return None
+        return tuple(header)
+
+    @staticmethod
+    def _checksum(buffer, start):
+        # срезы memoryview освобождаются сразу, чтобы mmap можно было закрыть
+        with memoryview(buffer) as view, view[start:] as body:
+            return zlib.crc32(body)
+
+    @classmethod
+    def loads(cls, buffer):
+        header = cls.header(buffer)
+        if header is None:
+            raise ValueError('Unknown flights file format')
+        _, _, n_strings, checksum = header
+        offset = cls.HEADER.size
+        if cls._checksum(buffer, offset) != checksum:
+            raise ValueError('Flights file is corrupted')
+
+        def read(n_bytes):
+            """Копия следующих n_bytes байт."""
+            nonlocal offset
+            if offset + n_bytes > len(buffer):
+                raise ValueError('Flights file is truncated')
+            data = buffer[offset:offset + n_bytes]
+            offset += n_bytes
+            return data
+
+        def read_array(typecode, n_items):
+            column = array(typecode)
+            column.frombytes(read(n_items * column.itemsize))
+            return column
+
+        ends = array('Q', accumulate(read_array('I', n_strings)))
+        strings = StringTable(read(ends[-1] if ends else 0), ends)
+        lengths = read_array('Q', len(cls.all_columns))
+        columns = {f_name: read_array(typecode, n_items)
+                   for (f_name, typecode), n_items in zip(cls.all_columns, lengths)}
+        if offset != len(buffer):
+            raise ValueError('Unexpected data at the end of flights file')
+
+        flights_columns = FlightsColumns()
+        for f_name in FlightsColumns.array_fields:
+            setattr(flights_columns, f_name, columns[f_name])
+        flights_columns.carriers = CodeTable.from_codes(strings[s_id] for s_id in columns['carrier_codes'])
+        flights_columns.airports = CodeTable.from_codes(strings[s_id] for s_id in columns['airport_codes'])
+
+        parts = {f_name: columns[f_name] for f_name, _ in cls.part_columns}
+        elements = StoredFlights(strings, parts, {f_name: columns[f_name] for f_name, _ in cls.flight_columns})
+        if len(elements) != len(flights_columns):
+            raise ValueError('Flights file columns do not match')
+        return Flights.from_columns(elements, flights_columns)
+
+
+class FlightsStore(ABC):
+    """Хранилище разобранных ответов партнеров, общее для всех процессов (воркеров) сервиса.
+
+    Результат разбора, сохраненный одним воркером, используется остальными. Для внешнего хранилища достаточно
+    реализовать load и save, а для разбора каждого файла только одним воркером - еще и lock. Хранилище
+    необязательно: при его недоступности методы не выбрасывают исключений, и файл разбирается заново.
+    """
+    @abstractmethod
+    def load(self, source_path):
+        """Перелеты из хранилища или None, если записи нет или она устарела."""
+
+    @abstractmethod
+    def save(self, source_path, flights):
+        """Сохраняет перелеты, разобранные из source_path."""
+
+    def lock(self, source_path):
+        """Межпроцессная блокировка на разбор source_path (контекстный менеджер)."""
+        return nullcontext()
+
+
+class FlightsDiskCache(FlightsStore):
+    """Дисковый кэш разобранных ответов партнеров.
+
+    Запись инвалидируется при изменении времени модификации или размера исходного файла. Кэш на локальном диске
+    общий для всех воркеров машины, файлы читаются через mmap.
+    """
+    SUFFIX = '.flights'
+    LOCK_SUFFIX = '.lock'
+
+    def __init__(self, dir_path, codec=FlightsCodec):
+        self.dir_path = dir_path
+        self.codec = codec
+
+    def _path(self, source_path):
+        # одноименные файлы из разных каталогов (например, разных партнеров) не должны совпадать
+        path_hash = md5(os.path.abspath(source_path).encode()).hexdigest()[:12]
+        return os.path.join(self.dir_path, '{}.{}{}'.format(os.path.basename(source_path), path_hash, self.SUFFIX))
+
+    def load(self, source_path):
+        if self.dir_path is None:
+            return None
+        try:
+            source = os.stat(source_path)
+            with open(self._path(source_path), 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                header = self.codec.header(buffer)
+                if header is None or header[:2] != (source.st_mtime_ns, source.st_size):
+                    return None
+                return self.codec.loads(buffer)
+        except Exception:
+            # запись, которую не удалось прочитать, считается отсутствующей: файл будет разобран и запись заменена
+            return None
+
+    def save(self, source_path, flights):
+        if self.dir_path is None:
+            return
+        path = self._path(source_path)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            source = os.stat(source_path)
+            data = self.codec.dumps(flights, source.st_mtime_ns, source.st_size)
+            os.makedirs(self.dir_path, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            # замена атомарна, читатели видят либо старый, либо новый файл целиком
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # каталог недоступен для записи или диск заполнен: перелеты остаются в памяти, файл разберут снова
+            logger.warning('Failed to save flights cache entry %s: %s', path, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _open_lock_file(self, source_path):
+        path = self._path(source_path) + self.LOCK_SUFFIX
+        try:
+            os.makedirs(self.dir_path, exist_ok=True)
+            return open(path, 'ab')
+        except OSError as e:
+            logger.warning('Failed to open flights cache lock %s, parsing without it: %s', path, e)
+            return None
+
+    @contextmanager
+    def lock(self, source_path):
+        """Блокировка flock на файле рядом с записью кэша; снимается и при завершении процесса-владельца.
+
+        Если файл блокировки недоступен, разбор идет без блокировки (файл могут разобрать несколько воркеров).
+        """
+        f = self._open_lock_file(source_path) if self.dir_path is not None else None
+        if f is None:
+            yield
+            return
+        with f:
+            try:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # блокировку держит другой процесс: ждем в потоке пула, не останавливая цикл событий
+                    gevent.get_hub().threadpool.apply(fcntl.flock, (f.fileno(), fcntl.LOCK_EX))
+                locked = True
+            except OSError as e:
+                logger.warning('Failed to lock %s, parsing without it: %s', f.name, e)
+                locked = False
+            try:
+                yield
+            finally:
+                if locked:
+                    fcntl.flock(f, fcntl.LOCK_UN)
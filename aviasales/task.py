@@ -1,35 +1,89 @@
+from contextlib import nullcontext
 from functools import wraps
+from itertools import islice
+from time import monotonic
 
 import gevent
-from cachetools import TTLCache, cached, keys
+from gevent.event import Event
+from gevent.lock import BoundedSemaphore
+from cachetools import keys
 
+from .cache import MemoryBoundedCache, estimated_size
 from .exceptions import TimeoutException
+from .metrics import collect_timings, extend_timings, registry, timer
+from .settings import (TASK_CACHE_EVICTION, TASK_CACHE_MAX_BYTES, TASK_CACHE_MAX_REFRESHES, TASK_CACHE_SIZE,
+                       TASK_CACHE_SOFT_TTL, TASK_CACHE_TTL)
 
-task_cache = TTLCache(maxsize=100, ttl=300)
+
+class TaskProgress:
+    """Промежуточные результаты задачи, доступные до ее завершения."""
+    PUBLISH_BATCH = 50  # после стольких результатов задача уступает управление другим гринлетам
+
+    def __init__(self):
+        self.items = []
+        self.finished = False
+        self._event = Event()
+
+    def _notify(self):
+        self._event.set()
+        self._event = Event()
+
+    def publish(self, item):
+        self.items.append(item)
+        if len(self.items) % self.PUBLISH_BATCH == 0:
+            self._notify()
+            gevent.sleep(0)
+
+    def published(self, iterable):
+        """Пропускает элементы iterable, публикуя каждый из них."""
+        for item in iterable:
+            self.publish(item)
+            yield item
+
+    def finish(self):
+        self.finished = True
+        # окончательный результат берется из задачи, промежуточные больше не нужны
+        self.items = []
+        self._notify()
+
+    def wait(self):
+        self._event.wait()
 
 
 class Task:
-    TIC_LENGTH = 0.1  # длина тика - 1/10 секунды
     SERVICE_KWARGS_PREFIX = '_service_kwargs_'
 
-    def __init__(self, func, *args, **kwargs):
+    def __init__(self, func, *args, with_progress=False, **kwargs):
         self._func = func
         self._args = args
         self._kwargs = kwargs
+        self.progress = TaskProgress() if with_progress else None
 
         self._task = None
         self._timeout = None
         self._running = None
         self._result = None
+        self._done = Event()
+        self.finished_at = None
         self.exception = None
+        # этапы, замеренные при последнем выполнении задачи (см. metrics.timer)
+        self.timings = []
 
     @property
     def _kwargs_without_service_kwargs(self):
-        return {k: v for k, v in self._kwargs.items() if self.SERVICE_KWARGS_PREFIX not in k}
+        return self.split_service_kwargs(self._kwargs)[1]
 
     @classmethod
     def service_kwargs(cls, **service_info_kwargs):
-        return {k + cls.SERVICE_KWARGS_PREFIX: v for k, v in service_info_kwargs}
+        return {cls.SERVICE_KWARGS_PREFIX + k: v for k, v in service_info_kwargs.items()}
+
+    @classmethod
+    def split_service_kwargs(cls, kwargs):
+        """Разделяет аргументы на служебные (для кэша) и аргументы функции задачи."""
+        service_kwargs, func_kwargs = {}, {}
+        for k, v in kwargs.items():
+            (service_kwargs if k.startswith(cls.SERVICE_KWARGS_PREFIX) else func_kwargs)[k] = v
+        return service_kwargs, func_kwargs
 
     @property
     def task_kwargs(self):
@@ -39,83 +93,204 @@ class Task:
         if timeout:
             self._timeout = timeout
         self._result = None
-        self._task = gevent.spawn(self._func, *self._args, **self._kwargs_without_service_kwargs)
+        self.exception = None
+        func_kwargs = self._kwargs_without_service_kwargs
+        if self.progress is not None:
+            func_kwargs['progress'] = self.progress
+        self.timings = []
+        self._task = gevent.spawn(self._call, *self._args, **func_kwargs)
         self._running = True
         try:
             self._task.join(gevent.Timeout(self._timeout, TimeoutException))
             self._result = self._task.value
+            self.exception = self._task.exception
         except TimeoutException:
             self.exception = TimeoutException
         finally:
-            self.exception = self._task.exception
             self._task = None
             self._running = False
+            self.finished_at = monotonic()
+            if self.progress is not None:
+                self.progress.finish()
+            # будим всех ожидающих результат сразу по завершении (или истечении времени) задачи
+            self._done.set()
+
+    def _call(self, *args, **kwargs):
+        with collect_timings(self.timings):
+            return self._func(*args, **kwargs)
 
     @property
     def running(self):
         return self._running
 
-    def _wait_result(self):
-        """Ожидаем окончание выполнения задачи."""
-        if self._timeout:
-            n_tics = self._timeout / self.TIC_LENGTH
-        else:
-            n_tics = None
-
-        if n_tics is None:
-            is_valid_time = lambda: True
-        else:
-            is_valid_time = lambda cur_n: cur_n < n_tics
+    def wait(self, timeout=None):
+        """Ожидаем окончание выполнения задачи (без опроса по таймеру).
 
-        n = 1
-        while self.running and is_valid_time(n):
-            gevent.sleep(self.TIC_LENGTH)
-            n += 1
+        Возвращает True, если задача завершилась.
+        """
+        return self._done.wait(timeout)
 
-    def _wait_starting(self):
-        """Ожидаем старта задачи."""
-        while self.running is None:
-            gevent.sleep(self.TIC_LENGTH)
+    def is_stale(self, ttl):
+        """Задача завершилась больше ttl секунд назад."""
+        return self.finished_at is not None and monotonic() - self.finished_at > ttl
 
     @property
     def result(self):
-        if self.running is None:
-            self._wait_starting()
+        """Результат задачи, при необходимости дожидается ее завершения.
 
-        if self.running:
-            self._wait_result()
+        Если пришлось ждать, этапы задачи (разбор, дисковый кэш) попадают в разбивку времени запроса перед
+        task_wait; при готовом результате запрос их не ждал, и они не добавляются.
+        """
+        with timer('task_wait'):
+            if not self._done.is_set():
+                self.wait()
+                extend_timings(self.timings)
 
         if self.exception:
             raise self.exception
         return self._result
 
+    def iter_progress(self):
+        """Результаты задачи по мере их публикации, после завершения - элементы итогового результата.
+
+        Работает для задач, созданных с with_progress=True.
+        """
+        progress = self.progress
+        n = 0
+        while not progress.finished:
+            items = progress.items
+            while n < len(items):
+                yield items[n]
+                n += 1
+            if not progress.finished:
+                progress.wait()
+
+        yield from islice(self.result, n, None)
+
 
-def task(timeout=20):
-    """Асинхронная задача."""
+def task(timeout=20, with_progress=False):
+    """Асинхронная задача.
+
+    При with_progress=True функция получает аргумент progress (TaskProgress) для публикации промежуточных результатов.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            t = Task(func, *args, **kwargs)
+            t = Task(func, *args, with_progress=with_progress, **kwargs)
             gevent.spawn(t.run, timeout)
             return t
         return wrapper
     return decorator
 
 
-def t_cached(cache=task_cache, key=keys.hashkey, lock=None):
+def task_size(t):
+    """Оценка объема памяти результата задачи в байтах (пока задача выполняется - 0)."""
+    return estimated_size(t._result) if t.running is False else 0
+
+
+task_cache = MemoryBoundedCache(TASK_CACHE_MAX_BYTES, TASK_CACHE_TTL, maxentries=TASK_CACHE_SIZE,
+                                policy=TASK_CACHE_EVICTION, getsizeof=task_size)
+
+
+@registry.register
+def task_cache_metrics():
+    stats = task_cache.stats()
+    return [
+        ('aviasales_task_cache_hits_total', 'counter', 'Попадания в кэш задач', stats['hits']),
+        ('aviasales_task_cache_misses_total', 'counter', 'Промахи кэша задач', stats['misses']),
+        ('aviasales_task_cache_evictions_total', 'counter', 'Вытеснения из кэша задач', stats['evictions']),
+        ('aviasales_task_cache_entries', 'gauge', 'Записей в кэше задач', stats['entries']),
+        ('aviasales_task_cache_bytes', 'gauge', 'Оценка объема кэша задач, байт', stats['bytes']),
+    ]
+
+
+class TaskRefresher:
+    """Фоновое обновление устаревших задач в кэше.
+
+    Одновременно обновляется не больше max_refreshes задач и не больше одной задачи на ключ. Задача заменяет
+    устаревшую в кэше только после успешного завершения, до этого отдается старый результат.
+    """
+    def __init__(self, max_refreshes=TASK_CACHE_MAX_REFRESHES):
+        self._semaphore = BoundedSemaphore(max_refreshes)
+        self._refreshing = set()
+
+    def refresh(self, cache, key, make_task):
+        """Запускает обновление, если оно еще не идет и есть свободное место. Возвращает True, если запущено."""
+        refreshing_key = (id(cache), key)
+        if refreshing_key in self._refreshing or not self._semaphore.acquire(blocking=False):
+            return False
+        self._refreshing.add(refreshing_key)
+        gevent.spawn(self._refresh, cache, key, make_task, refreshing_key)
+        return True
+
+    def _refresh(self, cache, key, make_task, refreshing_key):
+        try:
+            t = make_task()
+            t.wait()
+            if t.exception is None:
+                cache[key] = t
+                watch_size(cache, key, t)
+        finally:
+            self._refreshing.discard(refreshing_key)
+            self._semaphore.release()
+
+
+task_refresher = TaskRefresher()
+
+
+def watch_size(cache, key, t):
+    """Пересчитывает размер записи кэша при каждом изменении размера результата завершенной задачи.
+
+    Результат сообщает об изменении своего размера (например, о построении индексов или добавлении готового ответа)
+    вызовом функции в атрибуте on_size_change (см. models.Flights). Нужен кэш с методом resize (см. MemoryBoundedCache).
+    """
+    resize = getattr(cache, 'resize', None)
+    if resize is None or t.exception is not None or not hasattr(t._result, 'on_size_change'):
+        return
+    t._result.on_size_change = lambda: resize(key, t)
+
+
+def resize_when_finished(cache, key, t):
+    """Пересчитывает размер записи кэша по завершении задачи."""
+    if t.wait():
+        cache.resize(key, t)
+        watch_size(cache, key, t)
+
+
+def t_cached(cache=task_cache, key=keys.hashkey, lock=None, soft_ttl=TASK_CACHE_SOFT_TTL, refresher=task_refresher):
     """Кэш для задач.
 
     Модификация стандартного декоратора `cached` из cachetools. Задачи, упавшие с ошибками, удаляются из кэша для
-    возможности их повторного запуска.
+    возможности их повторного запуска. Задачи, завершившиеся больше soft_ttl секунд назад, отдаются из кэша, но
+    обновляются в фоне через refresher (soft_ttl=None - без фонового обновления).
+
+    Если у кэша есть метод resize (см. MemoryBoundedCache), размер записи пересчитывается по завершении задачи и
+    при изменении размера ее результата (см. watch_size).
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            kwargs[Task.SERVICE_KWARGS_PREFIX + 'func_name_for_cache'] = func.__name__
+            kwargs.update(Task.service_kwargs(func_name_for_cache=func.__name__))
             k = key(*args, **kwargs)
-            t = cache.get(k)
-            if t and t.running is False and t.exception is not None:
-                cache.pop(k)
-            return cached(cache, key, lock)(func)(*args, **kwargs)
+            with lock or nullcontext():
+                t = cache.get(k)
+            if t is not None and t.running is False and t.exception is not None:
+                with lock or nullcontext():
+                    cache.pop(k, None)
+                t = None
+            elif t is not None and soft_ttl is not None and t.is_stale(soft_ttl):
+                refresher.refresh(cache, k, lambda: func(*args, **kwargs))
+
+            if t is None:
+                t = func(*args, **kwargs)
+                try:
+                    with lock or nullcontext():
+                        cache[k] = t
+                except ValueError:
+                    pass  # значение больше кэша
+                resize = getattr(cache, 'resize', None)
+                if resize is not None:
+                    gevent.spawn(resize_when_finished, cache, k, t)
+            return t
         return wrapper
     return decorator
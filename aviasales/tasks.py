@@ -1,10 +1,63 @@
-from .models import FlightsInfo, Flights, FlightsInfoXmlParser
-from .task import task, t_cached
+from cachetools import keys
 
+from .exceptions import FlightsNotFound
+from .metrics import timer
+from .models import FlightsInfo, Flights, FlightsInfoXmlParser, StrictFlightsInfoXmlParser
+from .parsing import parse_flights
+from .settings import FLIGHTS_CACHE_DIR_PATH, STRICT_PARSING
+from .storage import FlightsDiskCache
+from .task import Task, task, t_cached
 
-@t_cached()
-@task()
-def get_flights_task(**kwargs):
-    flights_info = FlightsInfo.get_xml(**kwargs)
-    flights = Flights.from_flights_info(flights_info, FlightsInfoXmlParser)
+# общее для воркеров хранилище разобранных ответов (FlightsStore)
+flights_store = FlightsDiskCache(FLIGHTS_CACHE_DIR_PATH)
+flights_info_parser = StrictFlightsInfoXmlParser if STRICT_PARSING else FlightsInfoXmlParser
+
+
+def load_flights(flights_info, progress=None):
+    """Перелеты из файла с ответом партнера: из общего хранилища или разбором файла.
+
+    Файл разбирает только один воркер, остальные дожидаются его результата в хранилище.
+    """
+    with timer('store_load'):
+        flights = flights_store.load(flights_info)
+    if flights is not None:
+        return flights
+
+    with flights_store.lock(flights_info):
+        with timer('store_load'):
+            flights = flights_store.load(flights_info)
+        if flights is None:
+            with timer('parse'):
+                flights = parse_flights(flights_info_parser, flights_info)
+                if progress is not None:
+                    flights = progress.published(flights)
+                flights = Flights(flights, with_validate=False)
+            with timer('store_save'):
+                flights_store.save(flights_info, flights)
     return flights
+
+
+def search_key(normalize_params):
+    """Функция ключа кэша для задач поиска.
+
+    Ключ строится по каноническим параметрам normalize_params(*args, **params), поэтому равнозначные запросы
+    используют одну задачу.
+
+    Для параметров, по которым перелеты не найдутся, ключ строится по исходным параметрам (задача завершится
+    FlightsNotFound и будет удалена из кэша).
+    """
+    def key(*args, **kwargs):
+        service_kwargs, params = Task.split_service_kwargs(kwargs)
+        try:
+            params = normalize_params(*args, **params)
+        except FlightsNotFound:
+            pass
+        return keys.hashkey(*args, **service_kwargs, **params)
+    return key
+
+
+@t_cached(key=search_key(FlightsInfo.normalize_params))
+@task(with_progress=True)
+def get_flights_task(progress, **kwargs):
+    flights_info = FlightsInfo.get_xml(**kwargs)
+    return load_flights(flights_info, progress)
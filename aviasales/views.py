@@ -1,38 +1,263 @@
-from bottle import Bottle, request
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation, Overflow, ROUND_CEILING, ROUND_FLOOR
+from itertools import chain
+from math import isfinite
+from urllib.parse import parse_qsl
 
+from bottle import Bottle, request, response
+
+from .columns import to_minor_units, to_timestamp
+from .diff import FlightsDiff
+from .exceptions import InvalidParameter
 from .http_errors import ErrorsWrapperPlugin
-from .schemas import FlightsGeneralInfoSchema, FlightsSchema
+from .metrics import StageTimingsPlugin
+from .partners import fan_out_search
+from .profiling import ProfilingPlugin
+from .responses import json_response, response_cache
+from .scoring import Weights
+from .serializers import get_serializer
+from .settings import STAGE_TIMINGS_HEADER
 from .tasks import get_flights_task
 
 logic = Bottle()
 logic.install(ErrorsWrapperPlugin())
+logic.install(StageTimingsPlugin(with_header=STAGE_TIMINGS_HEADER))
+logic.install(ProfilingPlugin())
+
+FILTER_PARAMS = ('carrier', 'airport', 'n_transfers', 'min_price', 'max_price', 'departure_from', 'departure_to')
+# параметры, управляющие выдачей, а не поиском перелетов
+# веса оптимальности для /optimal: price_weight, time_weight, n_transfers_weight, transfer_time_weight
+WEIGHT_PARAMS = tuple(f_name + '_weight' for f_name in Weights._fields)
+VIEW_PARAMS = ('limit', 'offset', 'stream', 'deadline', ProfilingPlugin.PARAM) + FILTER_PARAMS + WEIGHT_PARAMS
+DEFAULT_LIMIT = 10
+# наибольший десятичный порядок цены в параметрах: цена в минимальных единицах валюты должна помещаться в int64, как
+# в колонке цен (иначе перевод огромных значений занимает секунды)
+MAX_PRICE_ORDER = 16
+
+
+def search_params():
+    return {k: v for k, v in request.params.items() if k not in VIEW_PARAMS}
+
+
+def to_int(value, name):
+    try:
+        value = int(value)
+    except ValueError:
+        raise InvalidParameter(name)
+    if value < 0:
+        raise InvalidParameter(name)
+    return value
+
+
+def int_param(name, default):
+    value = request.params.get(name)
+    if value is None:
+        return default
+    return to_int(value, name)
+
+
+def price_param(name, rounding):
+    """Граница цены в минимальных единицах валюты; rounding - направление округления до них."""
+    value = request.params.get(name)
+    if value is None:
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise InvalidParameter(name)
+    if not price.is_finite() or price.adjusted() > MAX_PRICE_ORDER:
+        raise InvalidParameter(name)
+    try:
+        return to_minor_units(price, rounding)
+    except (Overflow, InvalidOperation):
+        raise InvalidParameter(name)
+
+
+def float_param(name, default):
+    value = request.params.get(name)
+    if value is None:
+        return default
+    try:
+        value = float(value)
+    except ValueError:
+        raise InvalidParameter(name)
+    if not value >= 0:
+        raise InvalidParameter(name)
+    return value
+
+
+def timestamp_param(name):
+    """Время в формате ISO 8601 (как в general_info), без часового пояса считается UTC."""
+    value = request.params.get(name)
+    if value is None:
+        return None
+    try:
+        # "+" в query string декодируется в пробел
+        dt = datetime.fromisoformat(value.strip().replace(' ', '+'))
+        if dt.tzinfo is not None:
+            # у границ диапазона datetime перевод в UTC выходит за него (OverflowError)
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return to_timestamp(dt)
+    except (ValueError, OverflowError):
+        raise InvalidParameter(name)
+
+
+def weights_param():
+    """Веса оптимальности из параметров запроса (None, если ни один вес не задан)."""
+    weights = {}
+    for f_name, param in zip(Weights._fields, WEIGHT_PARAMS):
+        value = float_param(param, None)
+        if value is not None:
+            if not isfinite(value):
+                raise InvalidParameter(param)
+            weights[f_name] = value
+    return Weights.from_dict(weights) if weights else None
+
+
+def flights_filters():
+    """Фильтры перелетов из параметров запроса в виде аргументов Flights.select."""
+    params = request.params
+    filters = {}
+
+    for f_name, param in (('carriers', 'carrier'), ('airports', 'airport')):
+        values = params.getall(param)
+        if values:
+            filters[f_name] = tuple(sorted(set(values)))
+
+    values = params.getall('n_transfers')
+    if values:
+        filters['n_transfers'] = tuple(sorted({to_int(v, 'n_transfers') for v in values}))
+
+    # границы включительные: округление внутрь диапазона не меняет набор подходящих цен
+    for f_name, value in (('min_price', price_param('min_price', ROUND_CEILING)),
+                          ('max_price', price_param('max_price', ROUND_FLOOR)),
+                          ('departure_from', timestamp_param('departure_from')),
+                          ('departure_to', timestamp_param('departure_to'))):
+        if value is not None:
+            filters[f_name] = value
+
+    return filters
+
+
+def selected_rows(flights, filters, number=None, offset=0):
+    """Номера отфильтрованных перелетов с учетом пагинации."""
+    rows = flights.select(**filters)
+    return rows[offset:] if number is None else rows[offset:offset + number]
+
+
+def side_search_params(name):
+    """Параметры поиска одной из сторон сравнения: флаги через запятую, например "one_way,with_child"."""
+    value = request.params.get(name, '')
+    return dict(parse_qsl(value.replace(',', '&'), keep_blank_values=True))
+
+
+def cached_json(flights, make_json, *key):
+    """Ответ из кэша готовых ответов для перелетов flights; key дополняет путь запроса в ключе кэша."""
+    return json_response(response_cache.get(flights, (request.path,) + key, make_json))
+
+
+def top_flights(field_name, reverse=False, weights=None):
+    flights = get_flights_task(**search_params()).result
+    number, offset = int_param('limit', DEFAULT_LIMIT), int_param('offset', 0)
+    filters = flights_filters()
+
+    def make_json():
+        rows = flights.select(**filters) if filters else None
+        top = flights.top(field_name=field_name, reverse=reverse, number=number, offset=offset, rows=rows,
+                          weights=weights)
+        return get_serializer().dumps(top)
+    weights_key = weights.normalized() if weights else None
+    return cached_json(flights, make_json, number, offset, tuple(sorted(filters.items())), weights_key)
+
+
+def stream_flights(stream_format):
+    """Потоковая выдача перелетов по мере разбора ответа партнера: JSON-массивом или NDJSON (stream=ndjson)."""
+    if stream_format not in ('', 'json', 'ndjson'):
+        raise InvalidParameter('stream')
+
+    number, offset, filters = int_param('limit', None), int_param('offset', 0), flights_filters()
+    t = get_flights_task(**search_params())
+    if filters or number is not None or offset:
+        # для фильтрации нужны индексы по всему списку, поэтому ждем окончания разбора
+        result = t.result
+        flights = (result[i] for i in selected_rows(result, filters, number, offset))
+    else:
+        flights = t.iter_progress()
+    # первый перелет получаем до начала ответа, чтобы ошибки поиска вернулись с правильным статусом
+    first = next(flights, None)
+    if first is not None:
+        flights = chain([first], flights)
+
+    serializer = get_serializer()
+    if stream_format == 'ndjson':
+        response.content_type = 'application/x-ndjson'
+        return serializer.iter_ndjson(flights)
+
+    response.content_type = 'application/json'
+    return serializer.iter_json(flights)
 
 
 @logic.get('/all')
 def all_flights():
-    flights = get_flights_task(**request.params).result
-    return FlightsSchema().dump(flights)
+    stream_format = request.params.get('stream')
+    if stream_format is not None:
+        return stream_flights(stream_format)
+
+    flights = get_flights_task(**search_params()).result
+    number, offset, filters = int_param('limit', None), int_param('offset', 0), flights_filters()
+
+    def make_json():
+        if not filters and number is None and not offset:
+            return get_serializer().dumps(flights)
+        return get_serializer().dumps(flights[i] for i in selected_rows(flights, filters, number, offset))
+    return cached_json(flights, make_json, number, offset, tuple(sorted(filters.items())))
 
 
 @logic.get('/general_info')
 def flights_general():
-    flights = get_flights_task(**request.params).result
-    return FlightsGeneralInfoSchema().dump(flights.general_info)
+    flights = get_flights_task(**search_params()).result
+    return cached_json(flights, lambda: get_serializer().dumps_general_info(flights.general_info))
 
 
 @logic.get('/cheapest')
 def cheapest_flights():
-    flights = get_flights_task(**request.params).result
-    return FlightsSchema().dump({'flights': flights.top()})
+    return top_flights('price')
+
+
+@logic.get('/most_expensive')
+def most_expensive_flights():
+    return top_flights('price', reverse=True)
 
 
 @logic.get('/fastest')
 def fastest_flights():
-    flights = get_flights_task(**request.params).result
-    return FlightsSchema().dump({'flights': flights.top(field_name='time')})
+    return top_flights('time')
+
+
+@logic.get('/slowest')
+def slowest_flights():
+    return top_flights('time', reverse=True)
 
 
 @logic.get('/optimal')
 def optimal_flights():
-    flights = get_flights_task(**request.params).result
-    return FlightsSchema().dump({'flights': flights.top(field_name='optimality')})
+    return top_flights('optimality', weights=weights_param())
+
+
+@logic.get('/diff')
+def flights_diff():
+    """Отличия результатов поиска new от результатов поиска old."""
+    # задачи запускаются до ожидания результата, чтобы оба поиска выполнялись одновременно
+    old_task = get_flights_task(**side_search_params('old'))
+    new_task = get_flights_task(**side_search_params('new'))
+    diff = FlightsDiff(old_task.result, new_task.result)
+    return diff.as_dict(get_serializer().flight)
+
+
+@logic.get('/fan_out')
+def fan_out_flights():
+    """Перелеты всех партнеров, ответивших за отведенное время (параметр deadline, в секундах)."""
+    flights, reports = fan_out_search.search(deadline=float_param('deadline', None), **search_params())
+    data = get_serializer().flights(flights)
+    data['partners'] = [report._asdict() for report in reports]
+    return data
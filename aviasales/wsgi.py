@@ -1,6 +1,8 @@
 from bottle import Bottle
 
+from aviasales.metrics import metrics_view
 from aviasales.views import logic as api_logic
 
 app = Bottle()
 app.mount('/api', api_logic)
+app.route('/metrics', callback=metrics_view)
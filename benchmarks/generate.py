@@ -0,0 +1,197 @@
+"""Генератор синтетических ответов партнера (AirFareSearchResponse) произвольного размера.
+
+Запуск: ``python -m benchmarks.generate out.xml -n 1000000 [--one-way] [--with-child] [--with-infant]
+[--carriers QR=5,EK=1] [--hubs DOH=3,DEL=1] [--transfers 0=1,1=6,2=1] [--seed 0]``.
+
+Распределения задаются весами: перевозчик выбирается для маршрута (с вероятностью --interline - для каждого
+сегмента отдельно), число пересадок - для каждого маршрута, аэропорты пересадок - без повторов в маршруте. Файл
+пишется потоково, поэтому его размер ограничен только диском.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+DATETIME_FORMAT = '%Y-%m-%dT%H%M'
+
+CARRIERS = {
+    'QR': ('Qatar Airways', 30), 'EK': ('Emirates', 8), '9W': ('JetAirways', 6), 'WY': ('Oman Air', 6),
+    'MH': ('Malaysia Airlines', 6), 'EY': ('Etihad', 4), 'SQ': ('Singapore Airlines', 3),
+    'CZ': ('China Southern Airlines', 2), 'QF': ('Qantas', 2), 'TG': ('Thai', 2), 'AI': ('AirIndia', 2),
+    'PG': ('Bangkok Airways', 1), 'MU': ('China Eastern Airlines', 1), 'GF': ('Gulf Air', 1), 'KE': ('Korean Air', 1),
+    'TK': ('Turkish Air', 1),
+}
+HUBS = {
+    'DOH': 30, 'KUL': 5, 'BOM': 5, 'MCT': 4, 'DWC': 4, 'SIN': 2, 'AUH': 2, 'DEL': 2, 'CAN': 1, 'BAH': 1, 'ICN': 1,
+    'PVG': 1, 'CMB': 1, 'IST': 1,
+}
+TRANSFERS = {0: 1, 1: 6, 2: 1}
+CLASSES = 'NLKSYVUB'
+
+ROUTE_PART_TEMPLATE = '''\
+          <Flight>
+            <Carrier id="{carrier}">{carrier_name}</Carrier>
+            <FlightNumber>{flight_number}</FlightNumber>
+            <Source>{source}</Source>
+            <Destination>{destination}</Destination>
+            <DepartureTimeStamp>{departure}</DepartureTimeStamp>
+            <ArrivalTimeStamp>{arrival}</ArrivalTimeStamp>
+            <Class>{class_type}</Class>
+            <NumberOfStops>0</NumberOfStops>
+            <FareBasis>{fare_basis}</FareBasis>
+            <WarningText/>
+            <TicketType>E</TicketType>
+          </Flight>
+'''
+CHARGES_TEMPLATE = '''\
+      <ServiceCharges type="{type}" ChargeType="BaseFare">{base:.2f}</ServiceCharges>
+      <ServiceCharges type="{type}" ChargeType="AirlineTaxes">{taxes:.2f}</ServiceCharges>
+      <ServiceCharges type="{type}" ChargeType="TotalAmount">{total:.2f}</ServiceCharges>
+'''
+
+
+def parse_weights(value, key_type=str):
+    """'QR=5,EK=1' -> {'QR': 5.0, 'EK': 1.0}."""
+    weights = {}
+    for item in value.split(','):
+        key, _, weight = item.partition('=')
+        weights[key_type(key.strip())] = float(weight or 1)
+    return weights
+
+
+class WeightedChoice:
+    def __init__(self, weights):
+        self.values = list(weights)
+        self.cum_weights = list(accumulate(weights.values()))
+
+    def __call__(self, rng):
+        return rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+
+class ResponseGenerator:
+    """Потоковая генерация ответа партнера с заданными распределениями."""
+    def __init__(self, round_trip=True, with_child=False, with_infant=False, source='DXB', destination='BKK',
+                 date=datetime(2018, 10, 22), stay_days=7, carriers=None, hubs=None, transfers=None, interline=0.1,
+                 currency='SGD', seed=0):
+        self.round_trip = round_trip
+        self.with_child = with_child
+        self.with_infant = with_infant
+        self.source = source
+        self.destination = destination
+        self.date = date
+        self.stay = timedelta(days=stay_days)
+        self.carrier_names = {code: name for code, (name, _) in CARRIERS.items()}
+        carriers = carriers or {code: weight for code, (_, weight) in CARRIERS.items()}
+        self.carrier = WeightedChoice(carriers)
+        self.hubs = {hub: weight for hub, weight in (hubs or HUBS).items() if hub not in (source, destination)}
+        self.n_transfers = WeightedChoice(transfers or TRANSFERS)
+        self.interline = interline
+        self.currency = currency
+        self.rng = random.Random(seed)
+
+    def _transfer_airports(self, n):
+        hubs = dict(self.hubs)
+        airports = []
+        for _ in range(min(n, len(hubs))):
+            airport = WeightedChoice(hubs)(self.rng)
+            airports.append(airport)
+            del hubs[airport]
+        return airports
+
+    def route(self, source, destination, day):
+        """Части маршрута в виде xml и время в пути в часах."""
+        rng = self.rng
+        airports = [source] + self._transfer_airports(self.n_transfers(rng)) + [destination]
+        carrier = self.carrier(rng)
+        departure = day + timedelta(minutes=5 * rng.randrange(288))
+        started = departure
+        parts = []
+        for part_source, part_destination in zip(airports, airports[1:]):
+            if rng.random() < self.interline:
+                carrier = self.carrier(rng)
+            arrival = departure + timedelta(minutes=5 * rng.randrange(12, 120))
+            flight_number = rng.randrange(1, 10000)
+            parts.append(ROUTE_PART_TEMPLATE.format(
+                carrier=carrier, carrier_name=self.carrier_names.get(carrier, carrier), flight_number=flight_number,
+                source=part_source, destination=part_destination,
+                departure=departure.strftime(DATETIME_FORMAT), arrival=arrival.strftime(DATETIME_FORMAT),
+                class_type=rng.choice(CLASSES),
+                fare_basis='{:x}@@${}_{}_{}_{}'.format(rng.getrandbits(64), carrier, part_source, part_destination,
+                                                       flight_number),
+            ))
+            departure = arrival + timedelta(minutes=5 * rng.randrange(12, 144))
+        return ''.join(parts), (arrival - started).total_seconds() / 3600
+
+    def pricing(self, hours):
+        rng = self.rng
+        # дольше в пути - дешевле
+        base = rng.lognormvariate(5.5, 0.4) * (1 + 10 / (hours + 5))
+        taxes = base * rng.uniform(0.3, 1.2)
+        charges = [CHARGES_TEMPLATE.format(type='SingleAdult', base=base, taxes=taxes, total=base + taxes)]
+        if self.with_child:
+            charges.append(CHARGES_TEMPLATE.format(type='SingleChild', base=base * 0.75, taxes=taxes,
+                                                   total=base * 0.75 + taxes))
+        if self.with_infant:
+            charges.append(CHARGES_TEMPLATE.format(type='SingleInfant', base=base * 0.1, taxes=0,
+                                                   total=base * 0.1))
+        return '    <Pricing currency="{}">\n{}    </Pricing>\n'.format(self.currency, ''.join(charges))
+
+    def flight(self):
+        onward, hours = self.route(self.source, self.destination, self.date)
+        chunks = ['  <Flights>\n    <OnwardPricedItinerary>\n      <Flights>\n', onward,
+                  '      </Flights>\n    </OnwardPricedItinerary>\n']
+        if self.round_trip:
+            back, return_hours = self.route(self.destination, self.source, self.date + self.stay)
+            hours += return_hours
+            chunks += ['    <ReturnPricedItinerary>\n      <Flights>\n', back,
+                       '      </Flights>\n    </ReturnPricedItinerary>\n']
+        chunks += [self.pricing(hours), '  </Flights>\n']
+        return ''.join(chunks)
+
+    def iter_chunks(self, n_flights):
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n'
+               '<AirFareSearchResponse RequestTime="28-09-2015 20:23:49" ResponseTime="28-09-2015 20:23:56">\n'
+               '<RequestId>123ABCD</RequestId>\n<PricedItineraries>\n')
+        for _ in range(n_flights):
+            yield self.flight()
+        yield '</PricedItineraries>\n</AirFareSearchResponse>\n'
+
+    def write(self, path_or_file, n_flights):
+        if hasattr(path_or_file, 'write'):
+            path_or_file.writelines(self.iter_chunks(n_flights))
+            return
+        with open(path_or_file, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+            f.writelines(self.iter_chunks(n_flights))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('out', help='файл для ответа, - для stdout')
+    arg_parser.add_argument('-n', '--flights', type=int, default=10000, help='число перелетов')
+    arg_parser.add_argument('--one-way', action='store_true', help='без обратного маршрута')
+    arg_parser.add_argument('--with-child', action='store_true')
+    arg_parser.add_argument('--with-infant', action='store_true')
+    arg_parser.add_argument('--source', default='DXB')
+    arg_parser.add_argument('--destination', default='BKK')
+    arg_parser.add_argument('--carriers', type=parse_weights, help='веса перевозчиков: QR=5,EK=1')
+    arg_parser.add_argument('--hubs', type=parse_weights, help='веса аэропортов пересадок: DOH=3,DEL=1')
+    arg_parser.add_argument('--transfers', type=lambda value: parse_weights(value, int),
+                            help='веса числа пересадок в маршруте: 0=1,1=6,2=1')
+    arg_parser.add_argument('--interline', type=float, default=0.1,
+                            help='вероятность смены перевозчика на сегменте')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    generator = ResponseGenerator(
+        round_trip=not args.one_way, with_child=args.with_child, with_infant=args.with_infant,
+        source=args.source, destination=args.destination, carriers=args.carriers, hubs=args.hubs,
+        transfers=args.transfers, interline=args.interline, seed=args.seed)
+    started = time.monotonic()
+    generator.write(sys.stdout if args.out == '-' else args.out, args.flights)
+    print('{} flights in {:.1f} s'.format(args.flights, time.monotonic() - started), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
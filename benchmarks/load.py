@@ -0,0 +1,121 @@
+"""Нагрузочный тест: запросы в секунду и задержки сервиса при параллельных клиентах.
+
+Запуск против работающего сервера: ``python -m benchmarks.load --url http://localhost:8080``. С ``--server`` скрипт
+сам поднимает сервер на свободном порту: ``wsgiref`` - как debug.py, ``gevent`` - python -m aviasales.server, что
+позволяет сравнить их: ``python -m benchmarks.load --server wsgiref`` и ``--server gevent --workers 4``.
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import http.client  # noqa: E402
+import socket  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from statistics import median  # noqa: E402
+from urllib.parse import urlsplit  # noqa: E402
+
+import gevent  # noqa: E402
+
+PATHS = (
+    '/api/cheapest',
+    '/api/fastest?one_way&with_child&with_infant',
+    '/api/general_info',
+    '/api/all?limit=50&carrier=AI',
+)
+
+SERVERS = {
+    'wsgiref': [sys.executable, '-c', 'import sys; from bottle import run; from aviasales.wsgi import app; '
+                                      'run(app, host="127.0.0.1", port=int(sys.argv[1]), quiet=True)', '{port}'],
+    'gevent': [sys.executable, '-m', 'aviasales.server', '--host', '127.0.0.1', '--port', '{port}',
+               '--workers', '{workers}'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(name, workers):
+    port = free_port()
+    args = [arg.format(port=port, workers=workers) for arg in SERVERS[name]]
+    process = subprocess.Popen(args)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, 'http://127.0.0.1:{}'.format(port)
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('server did not start')
+
+
+def client(host, port, paths, deadline, latencies, errors):
+    """Клиент с keep-alive соединением, отправляющий запросы по кругу до deadline."""
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    n = 0
+    while time.monotonic() < deadline:
+        path = paths[n % len(paths)]
+        n += 1
+        started = time.monotonic()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            continue
+        latencies.append(time.monotonic() - started)
+
+
+def run(url, concurrency, duration, paths, warmup=1.0):
+    parts = urlsplit(url)
+    for phase_duration in (warmup, duration):
+        latencies, errors = [], []
+        started = time.monotonic()
+        deadline = started + phase_duration
+        gevent.joinall([gevent.spawn(client, parts.hostname, parts.port, paths, deadline, latencies, errors)
+                        for _ in range(concurrency)])
+        elapsed = time.monotonic() - started
+    return latencies, errors, elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--url', default='http://127.0.0.1:8080')
+    arg_parser.add_argument('--server', choices=sorted(SERVERS), help='поднять сервер самостоятельно')
+    arg_parser.add_argument('--workers', type=int, default=1, help='число воркеров для --server gevent')
+    arg_parser.add_argument('-c', '--concurrency', type=int, default=50, help='число параллельных клиентов')
+    arg_parser.add_argument('-d', '--duration', type=float, default=10, help='длительность теста, с')
+    arg_parser.add_argument('paths', nargs='*', default=PATHS)
+    args = arg_parser.parse_args()
+
+    process = None
+    url = args.url
+    if args.server:
+        process, url = start_server(args.server, args.workers)
+    try:
+        latencies, errors, elapsed = run(url, args.concurrency, args.duration, args.paths)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    latencies.sort()
+    print('server: {}, concurrency: {}, duration: {:.1f} s'.format(args.server or url, args.concurrency, elapsed))
+    print('requests: {}, errors: {}, rps: {:.1f}'.format(len(latencies), len(errors), len(latencies) / elapsed))
+    if latencies:
+        print('latency p50: {:.1f} ms, p99: {:.1f} ms, max: {:.1f} ms'.format(
+            median(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000, latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Память, занимаемая разобранными перелетами, в байтах на перелет.
+
+Запуск: ``python -m benchmarks.memory [files...] [--sizes 10000] [--json results.json]``, по умолчанию - все файлы из
+responses. Для каждого файла выводятся:
+
+* objects - прирост памяти (tracemalloc) после разбора в список объектов Flight;
+* deep - размер тех же объектов по deep_getsizeof (общие строки и даты учитываются один раз);
+* flights - прирост памяти после построения Flights вместе с колонками и общей информацией.
+"""
+import argparse
+import gc
+import json
+import platform
+import tracemalloc
+from glob import glob
+from os.path import basename
+
+from aviasales.cache import deep_getsizeof
+from aviasales.models import Flights, FlightsInfoXmlParser
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+from benchmarks.stages import scaled_response
+
+
+def allocated(func):
+    """Результат func и прирост занятой памяти, пока результат существует."""
+    FlightsInfoXmlParser._parse_datetime.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def measure(path_to_file):
+    flights, objects_bytes = allocated(lambda: list(FlightsInfoXmlParser.flights(path_to_file)))
+    n_flights = len(flights)
+    deep_bytes = deep_getsizeof(flights) - deep_getsizeof([]) - 8 * n_flights
+    del flights
+    _, flights_bytes = allocated(lambda: Flights.from_flights_info(path_to_file, FlightsInfoXmlParser))
+    return {
+        'file': basename(path_to_file),
+        'flights': n_flights,
+        'objects': objects_bytes / n_flights,
+        'deep': deep_bytes / n_flights,
+        'flights_total': flights_bytes / n_flights,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('files', nargs='*', default=sorted(glob(FLIGHTS_INFO_DIR_PATH + '/*.xml')),
+                            help='ответы партнеров, по умолчанию - все файлы из responses')
+    arg_parser.add_argument('--sizes', type=int, nargs='*', default=(),
+                            help='размеры (число перелетов) синтетических ответов')
+    arg_parser.add_argument('--json', help='файл для результатов в JSON')
+    args = arg_parser.parse_args()
+
+    files = list(args.files) + [scaled_response(size) for size in args.sizes]
+    print('{:<45} {:>8} {:>10} {:>10} {:>10}'.format('file', 'flights', 'objects', 'deep', 'flights'))
+    results = []
+    for path_to_file in files:
+        result = measure(path_to_file)
+        results.append(result)
+        print('{file:<45} {flights:>8} {objects:>10.0f} {deep:>10.0f} {flights_total:>10.0f}'.format(**result),
+              flush=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Время разбора ответов партнеров в быстром и строгом режимах.
+
+Запуск: ``python -m benchmarks.parse [files...]``, по умолчанию - все файлы из responses.
+"""
+import argparse
+from glob import glob
+from os.path import basename
+from timeit import repeat
+
+from aviasales.models import Flights, FlightsInfoXmlParser, StrictFlightsInfoXmlParser
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+
+PARSERS = (
+    ('fast', FlightsInfoXmlParser),
+    ('strict', StrictFlightsInfoXmlParser),
+)
+
+
+def parse_time(path_to_file, parser, number):
+    """Лучшее из нескольких измерений время разбора файла в секундах."""
+    FlightsInfoXmlParser._parse_datetime.cache_clear()
+    return min(repeat(lambda: Flights.from_flights_info(path_to_file, parser), number=1, repeat=number))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('files', nargs='*', default=sorted(glob(FLIGHTS_INFO_DIR_PATH + '/*.xml')))
+    arg_parser.add_argument('-n', '--number', type=int, default=5, help='число повторов')
+    args = arg_parser.parse_args()
+
+    print('{:<40} {:>10} {:>12} {:>12} {:>8}'.format('file', 'flights', 'fast, ms', 'strict, ms', 'speedup'))
+    for path_to_file in args.files:
+        n_flights = len(Flights.from_flights_info(path_to_file, FlightsInfoXmlParser))
+        times = {name: parse_time(path_to_file, parser, args.number) for name, parser in PARSERS}
+        print('{:<40} {:>10} {:>12.1f} {:>12.1f} {:>7.1f}x'.format(
+            basename(path_to_file), n_flights, times['fast'] * 1000, times['strict'] * 1000,
+            times['strict'] / times['fast']))
+
+
+if __name__ == '__main__':
+    main()
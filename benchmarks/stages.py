@@ -0,0 +1,148 @@
+"""Время отдельных этапов обработки ответа партнера: разбор, общая информация, выборка лучших и сериализация.
+
+Запуск: ``python -m benchmarks.stages [--sizes 10000 100000] [--json results.json] [--compare baseline.json]``.
+Кроме файлов из responses, измерения проводятся на синтетических ответах (benchmarks.generate) заданного размера.
+С --compare скрипт завершается с кодом 1, если какой-либо этап замедлился больше, чем на --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from glob import glob
+from os.path import basename, join
+from statistics import median
+from timeit import repeat
+
+from aviasales.aggregation import GeneralInfoAccumulator
+from aviasales.models import Flights, FlightsInfoXmlParser, StrictFlightsInfoXmlParser
+from aviasales.schemas import FlightSchema, FlightsGeneralInfoSchema, FlightsSchema
+from aviasales.scoring import DEFAULT_WEIGHTS, Weights, scores
+from aviasales.serializers import serializers
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+from benchmarks.generate import ResponseGenerator
+
+TOP_FIELDS = ('price', 'time', 'optimality')
+# веса оптимальности по всем полям
+ALL_FIELDS_WEIGHTS = Weights(price=0.4, time=0.3, n_transfers=0.2, transfer_time=0.1)
+DEFAULT_SIZES = (10000, 100000)
+DATA_DIR_PATH = join(tempfile.gettempdir(), 'aviasales-benchmarks')
+
+
+def scaled_response(n_flights, dir_path=DATA_DIR_PATH):
+    """Синтетический ответ партнера с n_flights перелетами туда и обратно (создается один раз)."""
+    path = join(dir_path, 'generated.{}.xml'.format(n_flights))
+    if not os.path.exists(path):
+        os.makedirs(dir_path, exist_ok=True)
+        ResponseGenerator(with_child=True, with_infant=True, seed=n_flights).write(path + '.tmp', n_flights)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def stages(path_to_file, flights):
+    """Пары (имя этапа, функция без аргументов) для файла и разобранных из него перелетов."""
+    top = flights.top(number=10)
+
+    yield 'parse/fast', lambda: list(FlightsInfoXmlParser.flights(path_to_file))
+    yield 'parse/strict', lambda: list(StrictFlightsInfoXmlParser.flights(path_to_file))
+    yield 'flights/build', lambda: Flights(flights.flights, with_validate=False)
+    yield 'general_info/aggregate', lambda: GeneralInfoAccumulator.from_flights(flights).general_info
+    # общая информация по готовым колонкам, как при загрузке из дискового кэша
+    yield 'general_info/from_columns', lambda: GeneralInfoAccumulator.from_columns(flights.columns).general_info
+    for field_name in TOP_FIELDS:
+        yield 'top/' + field_name, lambda field_name=field_name: flights.top(field_name)
+        yield 'top/{}/reverse'.format(field_name), lambda field_name=field_name: flights.top(field_name, reverse=True)
+    # расчет колонки оптимальности без кэша, как при первом запросе с новыми весами
+    yield 'scores/default', lambda: scores(flights.columns, DEFAULT_WEIGHTS)
+    yield 'scores/all_fields', lambda: scores(flights.columns, ALL_FIELDS_WEIGHTS)
+    yield 'dump/FlightSchema', lambda: FlightSchema(many=True).dump(top)
+    yield 'dump/FlightsSchema', lambda: FlightsSchema().dump({'flights': flights})
+    yield 'dump/FlightsGeneralInfoSchema', lambda: FlightsGeneralInfoSchema().dump(flights.general_info)
+    # JSON ответов целиком каждым из сериализаторов
+    for name in sorted(serializers):
+        serializer = serializers[name]
+        yield 'dumps/{}/top'.format(name), lambda serializer=serializer: serializer.dumps(top)
+        yield 'dumps/{}/flights'.format(name), lambda serializer=serializer: serializer.dumps(flights)
+        yield 'dumps/{}/general_info'.format(name), \
+            lambda serializer=serializer: serializer.dumps_general_info(flights.general_info)
+
+
+def measure(func, number, max_time):
+    """Времена number запусков func; медленные этапы повторяются, пока их суммарное время меньше max_time."""
+    FlightsInfoXmlParser._parse_datetime.cache_clear()
+    func()  # прогрев: ленивые колонки, кэши
+    times = []
+    while len(times) < number and (not times or sum(times) < max_time):
+        times.extend(repeat(func, number=1, repeat=1))
+    return times
+
+
+def run(files, number, max_time, stage_prefixes=None):
+    results = []
+    for path_to_file in files:
+        flights = Flights.from_flights_info(path_to_file, FlightsInfoXmlParser)
+        for stage, func in stages(path_to_file, flights):
+            if stage_prefixes and not stage.startswith(tuple(stage_prefixes)):
+                continue
+            times = measure(func, number, max_time)
+            result = {
+                'stage': stage,
+                'file': basename(path_to_file),
+                'flights': len(flights),
+                'best_ms': min(times) * 1000,
+                'median_ms': median(times) * 1000,
+                'repeat': len(times),
+            }
+            results.append(result)
+            print('{file:<45} {flights:>8} {stage:<32} {best_ms:>12.3f} {median_ms:>12.3f}'.format(**result),
+                  flush=True)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Этапы, время которых (лучшее из повторов) выросло больше, чем в 1 + threshold раз относительно baseline."""
+    old = {(r['file'], r['stage']): r['best_ms'] for r in baseline['results']}
+    return [
+        (r, old[r['file'], r['stage']]) for r in results
+        if (r['file'], r['stage']) in old and r['best_ms'] > old[r['file'], r['stage']] * (1 + threshold)
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('files', nargs='*', default=sorted(glob(FLIGHTS_INFO_DIR_PATH + '/*.xml')),
+                            help='ответы партнеров, по умолчанию - все файлы из responses')
+    arg_parser.add_argument('--sizes', type=int, nargs='*', default=DEFAULT_SIZES,
+                            help='размеры (число перелетов) синтетических ответов')
+    arg_parser.add_argument('--stages', nargs='*', help='только этапы с этими префиксами, например parse top')
+    arg_parser.add_argument('-n', '--number', type=int, default=5, help='число повторов')
+    arg_parser.add_argument('--max-time', type=float, default=10,
+                            help='время, после которого этап больше не повторяется, с')
+    arg_parser.add_argument('--json', help='файл для результатов в JSON')
+    arg_parser.add_argument('--compare', help='JSON с результатами предыдущего запуска')
+    arg_parser.add_argument('--threshold', type=float, default=0.2, help='допустимое замедление, доля')
+    args = arg_parser.parse_args()
+
+    files = list(args.files)
+    for size in args.sizes:
+        files.append(scaled_response(size))
+
+    print('{:<45} {:>8} {:<32} {:>12} {:>12}'.format('file', 'flights', 'stage', 'best, ms', 'median, ms'))
+    results = run(files, args.number, args.max_time, args.stages)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = regressions(results, json.load(f), args.threshold)
+        for result, old_ms in slower:
+            print('REGRESSION {file} {stage}: {:.3f} -> {best_ms:.3f} ms'.format(old_ms, **result))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Задержка между завершением задачи и получением результата ожидающими ее гринлетами.
+
+Запуск: ``python -m benchmarks.task_wait [-n 1 10 100 1000] [--duration 0.05]``.
+"""
+import argparse
+from statistics import median
+from time import monotonic
+
+import gevent
+
+from aviasales.task import task
+
+
+def wait_latencies(n_waiters, duration):
+    """Задержки (в секундах) пробуждения n_waiters гринлетов, ожидающих одну задачу."""
+    finished = []
+
+    @task()
+    def sleeping_task():
+        gevent.sleep(duration)
+        finished.append(monotonic())
+
+    t = sleeping_task()
+    woken = []
+
+    def wait():
+        t.result
+        woken.append(monotonic())
+
+    gevent.joinall([gevent.spawn(wait) for _ in range(n_waiters)])
+    return [w - finished[0] for w in woken]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('-n', '--waiters', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    arg_parser.add_argument('--duration', type=float, default=0.05, help='время выполнения задачи, с')
+    args = arg_parser.parse_args()
+
+    print('{:>10} {:>12} {:>12}'.format('waiters', 'p50, ms', 'max, ms'))
+    for n_waiters in args.waiters:
+        latencies = wait_latencies(n_waiters, args.duration)
+        print('{:>10} {:>12.3f} {:>12.3f}'.format(n_waiters, median(latencies) * 1000, max(latencies) * 1000))
+
+
+if __name__ == '__main__':
+    main()
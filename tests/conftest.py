@@ -0,0 +1,34 @@
+from os.path import join
+
+import gevent
+import pytest
+
+from aviasales.models import Flights, FlightsInfoXmlParser
+from aviasales.partners import Partner
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+
+
+class MockPartner(Partner):
+    """Локальный партнер для тестов: отвечает заданными перелетами с задержкой или ошибкой."""
+    def __init__(self, name, file_name='round_trip_adult.xml', delay=0, exception=None, price_delta=0):
+        super().__init__(name)
+        self.file_name = file_name
+        self.delay = delay
+        self.exception = exception
+        self.price_delta = price_delta
+        self.n_calls = 0
+
+    def flights(self, **params):
+        self.n_calls += 1
+        gevent.sleep(self.delay)
+        if self.exception:
+            raise self.exception
+        flights = Flights.from_flights_info(join(FLIGHTS_INFO_DIR_PATH, self.file_name), FlightsInfoXmlParser)
+        for flight in flights:
+            flight.pricing.adult += self.price_delta
+        return Flights(flights, with_validate=False)
+
+
+@pytest.fixture
+def mock_partner():
+    return MockPartner
@@ -0,0 +1,40 @@
+from os.path import join
+
+from aviasales.aggregation import GeneralInfoAccumulator
+from aviasales.models import FlightsInfoXmlParser, Flights
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+
+
+def flights(file_name):
+    path_to_file = join(FLIGHTS_INFO_DIR_PATH, file_name)
+    return Flights.from_flights_info(path_to_file, FlightsInfoXmlParser)
+
+
+def normalized(general_info):
+    return {k: sorted(v) if k in ('airports', 'carriers', 'n_transfers') else v for k, v in general_info.items()}
+
+
+def test_general_info_single_pass():
+    fs = flights('one_way_with_child_and_infant.xml')
+    general_info = GeneralInfoAccumulator.from_flights(fs).general_info
+
+    assert normalized(general_info) == normalized(fs.general_info)
+    assert general_info['quantity'] == len(fs)
+    assert general_info['price'] == (min(f.price for f in fs), max(f.price for f in fs))
+    assert general_info['time'] == (min(f.time for f in fs), max(f.time for f in fs))
+    assert general_info['return_dep_time'] is None
+
+
+def test_general_info_merge():
+    fs = flights('one_way_with_child_and_infant.xml')
+    half = len(fs) // 2
+
+    merged = GeneralInfoAccumulator.from_flights(fs[:half]).merge(GeneralInfoAccumulator.from_flights(fs[half:]))
+    assert normalized(merged.general_info) == normalized(fs.general_info)
+
+    # перелет без обратного маршрута делает границы обратного маршрута неопределенными
+    round_trip = flights('round_trip_adult.xml')
+    assert round_trip.general_info['return_dep_time'] is not None
+    merged = GeneralInfoAccumulator.from_flights(round_trip).merge(GeneralInfoAccumulator.from_flights(fs))
+    assert merged.borders('return_dep_time') is None
+    assert merged.quantity == len(fs) + len(round_trip)
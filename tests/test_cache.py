@@ -0,0 +1,121 @@
+import gevent
+import pytest
+
+from aviasales.cache import MemoryBoundedCache, deep_getsizeof, estimated_size
+from aviasales.scoring import Weights
+from aviasales.task import task, t_cached, task_size
+from tests.test_models import response_flights
+
+
+def test_estimated_size():
+    flights = response_flights('round_trip_adult.xml')
+    flights.index
+    flights.keys
+    flights.optimality
+
+    exact = deep_getsizeof(flights)
+    assert exact > len(flights) * 1000
+    assert exact * 0.95 < estimated_size(flights) < exact * 1.25
+
+
+@pytest.mark.parametrize('policy, evicted', [
+    ('lru', 'b'),
+    ('lfu', 'a'),
+])
+def test_memory_bounded_cache_eviction(policy, evicted):
+    cache = MemoryBoundedCache(maxsize=300, ttl=10, policy=policy, getsizeof=len)
+    cache['a'] = 'a' * 100
+    cache['b'] = 'b' * 100
+    cache['c'] = 'c' * 100
+    cache.get('b')
+    cache.get('b')
+    cache.get('a')
+    cache.get('c')
+    cache['d'] = 'd' * 100
+
+    assert evicted not in cache
+    assert len(cache) == 3
+    assert cache.get('x') is None
+    assert cache.stats() == {
+        'entries': 3, 'bytes': 300, 'max_bytes': 300, 'hits': 4, 'misses': 1, 'evictions': 1,
+    }
+
+
+def test_memory_bounded_cache_limits():
+    cache = MemoryBoundedCache(maxsize=300, ttl=10, maxentries=2, getsizeof=len)
+    cache['a'] = 'a'
+    cache['b'] = 'b'
+    cache['c'] = 'c'
+    assert list(cache) == ['b', 'c']
+
+    # значение, выросшее больше всего кэша, удаляется
+    value = ['x']
+    cache['x'] = value
+    value.extend(range(400))
+    cache.resize('x', value)
+    assert 'x' not in cache
+    assert cache.currsize == 1
+
+
+def test_resize_keeps_expiry_and_order():
+    cache = MemoryBoundedCache(maxsize=300, ttl=0.3, getsizeof=len)
+    value = ['x']
+    cache['x'] = value
+    cache['y'] = 'y'
+    for n in range(5):
+        gevent.sleep(0.1)
+        value.append(n)
+        cache.resize('x', value)
+        if 'x' not in cache:
+            break
+    # запись истекает по исходному TTL, хотя ее размер пересчитывался
+    assert n < 4 and 'x' not in cache
+
+    cache = MemoryBoundedCache(maxsize=10, ttl=10, getsizeof=len)
+    value = ['a']
+    cache['a'] = value
+    cache['b'] = 'bbb'
+    value.extend(range(8))
+    cache.resize('a', value)
+    # вытесняется давно добавленная запись, размер которой пересчитан
+    assert list(cache) == ['b'] and cache.currsize == 3
+
+
+def test_t_cached_resizes_finished_tasks():
+    cache = MemoryBoundedCache(maxsize=10 ** 6, ttl=10, getsizeof=task_size)
+
+    @t_cached(cache=cache)
+    @task()
+    def big_task(n):
+        gevent.sleep(0.01)
+        return list(range(n))
+
+    t = big_task(1000)
+    assert cache.currsize == 0
+    t.result
+    gevent.sleep(0)
+    assert cache.currsize == task_size(t) > 1000 * 8
+
+    for n in range(2000, 40000, 2000):
+        big_task(n).result
+        gevent.sleep(0)
+        assert cache.currsize <= cache.maxsize
+    assert cache.evictions > 0
+    assert big_task(38000).result is big_task(38000).result
+
+
+def test_t_cached_resizes_when_result_grows():
+    cache = MemoryBoundedCache(maxsize=10 ** 9, ttl=10, getsizeof=task_size)
+
+    @t_cached(cache=cache)
+    @task()
+    def flights_task():
+        return response_flights('round_trip_adult.xml')
+
+    flights = flights_task().result
+    gevent.sleep(0)
+    for build in (lambda: flights.index, lambda: flights.keys, lambda: flights.scores(Weights(1, 1, 1, 1))):
+        size = cache.currsize
+        build()
+        assert cache.currsize > size
+    assert cache.currsize == estimated_size(flights)
@@ -0,0 +1,80 @@
+from webtest import TestApp
+
+from aviasales.metrics import Histogram, collect_timings, stage_seconds, timer
+from aviasales.task import task_cache
+from aviasales.wsgi import app
+from tests.test_models import response_flights
+
+
+def test_histogram():
+    histogram = Histogram('test_seconds', 'Test', 'stage', buckets=(0.1, 1))
+    histogram.observe('a', 0.05)
+    histogram.observe('a', 0.5)
+    histogram.observe('a', 5)
+    histogram.observe('b"', 0.1)
+
+    assert histogram.expose() == [
+        '# HELP test_seconds Test',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{stage="a",le="0.1"} 1',
+        'test_seconds_bucket{stage="a",le="1.0"} 2',
+        'test_seconds_bucket{stage="a",le="+Inf"} 3',
+        'test_seconds_sum{stage="a"} 5.55',
+        'test_seconds_count{stage="a"} 3',
+        'test_seconds_bucket{stage="b\\"",le="0.1"} 1',
+        'test_seconds_bucket{stage="b\\"",le="1.0"} 1',
+        'test_seconds_bucket{stage="b\\"",le="+Inf"} 1',
+        'test_seconds_sum{stage="b\\""} 0.1',
+        'test_seconds_count{stage="b\\""} 1',
+    ]
+
+
+def test_timer():
+    count = stage_seconds.count('test_stage')
+    try:
+        with timer('test_stage'):
+            raise ValueError
+    except ValueError:
+        pass
+    assert stage_seconds.count('test_stage') == count + 1
+
+
+def timing_stages(res):
+    return [item.split(';')[0] for item in res.headers['Server-Timing'].split(', ')]
+
+
+def test_stage_timings_and_metrics():
+    test_app = TestApp(app)
+
+    res = test_app.get('/api/cheapest?limit=3', headers={'X-Debug-Timings': '1'})
+    stages = timing_stages(res)
+    assert {'task_wait', 'top', 'dump'} <= set(stages)
+    assert 'Server-Timing' not in test_app.get('/api/fastest').headers
+
+    metrics = test_app.get('/metrics')
+    assert metrics.content_type == 'text/plain'
+    lines = metrics.text.splitlines()
+    for stage in ('task_wait', 'store_load', 'general_info', 'top', 'dump'):
+        assert any(line.startswith('aviasales_stage_seconds_count{stage="%s"}' % stage) for line in lines)
+    assert any(line.startswith('aviasales_request_seconds_count{route="/cheapest"}') for line in lines)
+    assert any(line.startswith('aviasales_task_cache_hits_total ') for line in lines)
+
+
+def test_general_info_stage():
+    timings = []
+    with collect_timings(timings):
+        response_flights('round_trip_adult.xml')
+    assert [stage for stage, _ in timings] == ['general_info']
+    assert timings[0][1] > 0
+
+
+def test_task_stages_reach_waiting_request():
+    task_cache.clear()
+    test_app = TestApp(app)
+    headers = {'X-Debug-Timings': '1'}
+
+    stages = timing_stages(test_app.get('/api/cheapest?limit=3', headers=headers))
+    assert stages.index('store_load') < stages.index('task_wait')
+    # готовый результат запрос не ждал
+    stages = timing_stages(test_app.get('/api/fastest', headers=headers))
+    assert 'task_wait' in stages and 'store_load' not in stages
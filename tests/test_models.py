@@ -1,10 +1,15 @@
+from datetime import timedelta
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
 from os.path import abspath, join, dirname
 
 import pytest
 
+from aviasales.columns import from_minor_units, to_minor_units, to_timestamp
+from aviasales.diff import FlightsDiff
 from aviasales.exceptions import FlightsNotFound
-from aviasales.models import FlightsInfo, FlightsInfoXmlParser, Flights
-from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+from aviasales.models import FlightsInfo, FlightsInfoXmlParser, Flights, StrictFlightsInfoXmlParser
+from aviasales.scoring import DEFAULT_WEIGHTS, Weights
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH, OPTIMALITY_SCORES_CACHE_SIZE
 
 
 def one_way_with_child_and_infant_flights():
@@ -19,6 +24,11 @@ def round_trip_adult_flights():
     return Flights.from_flights_info(path_to_file, FlightsInfoXmlParser)
 
 
+def response_flights(file_name):
+    """Полный ответ партнера из FLIGHTS_INFO_DIR_PATH (в fixtures ответы сокращены до одного перелета)."""
+    return Flights.from_flights_info(join(FLIGHTS_INFO_DIR_PATH, file_name), FlightsInfoXmlParser)
+
+
 def test_flights_info_get_xml():
     params = {}
     assert FlightsInfo.get_xml(**params) == FLIGHTS_INFO_DIR_PATH + '/round_trip_adult.xml'
@@ -31,6 +41,23 @@ def test_flights_info_get_xml():
         FlightsInfo.get_xml(**params)
 
 
+@pytest.mark.parametrize("params, normalized", [
+    ({}, {}),
+    ({'one_way': '', 'with_child': '', 'with_infant': ''}, {'one_way': '', 'with_child': '', 'with_infant': ''}),
+    ({'with_infant': '1', 'one_way': 'true', 'with_child': '', 'utm_source': 'x'},
+     {'one_way': '', 'with_child': '', 'with_infant': ''}),
+    ({'utm_source': 'x'}, None),
+    ({'one_way': ''}, None),
+])
+def test_flights_info_normalize_params(params, normalized):
+    if normalized is None:
+        with pytest.raises(FlightsNotFound):
+            FlightsInfo.normalize_params(**params)
+    else:
+        assert FlightsInfo.normalize_params(**params) == normalized
+        assert FlightsInfo.get_xml(**normalized) == FlightsInfo.get_xml(**params)
+
+
 def test_collection_creating():
     with pytest.raises(AssertionError) as exc_info:
         Flights(None)
@@ -56,3 +83,146 @@ def test_route():
     assert route.n_transfers == 1
     assert route.source == 'DXB'
     assert route.destination == 'BKK'
+
+
+def test_flights_columns():
+    fs = response_flights('one_way_with_child_and_infant.xml')
+    columns = fs.columns
+
+    assert len(columns) == len(fs)
+    for i, f in enumerate(fs):
+        assert columns.price[i] == to_minor_units(f.price)
+        assert from_minor_units(columns.price[i]) == f.price
+        assert columns.time[i] == f.time
+        assert columns.transfer_time[i] == f.transfer_time
+        assert sorted(columns.flight_carriers(i)) == sorted(f.carriers)
+        assert sorted(columns.flight_airports(i)) == sorted(f.airports)
+
+    assert fs.general_info['price'] == (min(f.price for f in fs), max(f.price for f in fs))
+    assert fs.general_info['return_dep_time'] is None
+    assert fs.top()[0].price == fs.general_info['price'][0]
+
+
+@pytest.mark.parametrize("field_name, key", [
+    ('price', lambda f: f.price),
+    ('time', lambda f: f.time),
+])
+@pytest.mark.parametrize("reverse", [False, True])
+@pytest.mark.parametrize("number, offset", [(10, 0), (5, 7), (1000, 0), (10, 1000)])
+def test_flights_top(field_name, key, reverse, number, offset):
+    fs = response_flights('one_way_with_child_and_infant.xml')
+    expected = sorted(fs, key=key, reverse=reverse)[offset:offset + number]
+    assert fs.top(field_name, number=number, reverse=reverse, offset=offset) == expected
+
+
+def test_minor_units():
+    assert to_minor_units(Decimal('1234.56')) == 123456
+    assert to_minor_units(Decimal('0.005')) == 0
+    assert to_minor_units(Decimal('10.001'), ROUND_CEILING) == 1001
+    assert to_minor_units(Decimal('10.009'), ROUND_FLOOR) == 1000
+    assert str(from_minor_units(123450)) == '1234.50'
+
+
+@pytest.mark.parametrize("file_name", ['round_trip_adult.xml', 'one_way_with_child_and_infant.xml'])
+@pytest.mark.parametrize("weights", [
+    None,
+    Weights(price=1, time=0, n_transfers=0, transfer_time=0),
+    Weights(price=0.4, time=0.2, n_transfers=0.3, transfer_time=0.1),
+])
+def test_flights_scores(file_name, weights):
+    fs = response_flights(file_name)
+
+    def expected(f):
+        score = Decimal(0)
+        for f_name, weight in zip(Weights._fields, weights or DEFAULT_WEIGHTS):
+            values = [getattr(flight, f_name) for flight in fs]
+            low, high = min(values), max(values)
+            normalized = Decimal(getattr(f, f_name) - low) / (high - low) if high != low else 1
+            score += Decimal(weight) * normalized
+        return score
+
+    for f, score in zip(fs, fs.scores(weights)):
+        assert score == pytest.approx(float(expected(f)))
+    assert [expected(f) for f in fs.top('optimality', number=20, weights=weights)] == sorted(map(expected, fs))[:20]
+
+
+def test_flights_scores_memoized():
+    fs = response_flights('round_trip_adult.xml')
+    weights = Weights(price=1, time=1, n_transfers=0, transfer_time=0)
+
+    assert fs.scores(weights) is fs.scores(Weights(price=0.5, time=0.5, n_transfers=0, transfer_time=0))
+    assert fs.optimality is fs.scores(DEFAULT_WEIGHTS)
+    for i in range(OPTIMALITY_SCORES_CACHE_SIZE + 1):
+        fs.scores(Weights(price=1, time=i, n_transfers=0, transfer_time=0))
+    assert len(fs._scores) == OPTIMALITY_SCORES_CACHE_SIZE
+
+
+def test_flights_select():
+    fs = response_flights('one_way_with_child_and_infant.xml')
+    prices = sorted({f.price for f in fs})
+    min_price, max_price = prices[len(prices) // 4], prices[len(prices) // 2]
+    departures = sorted({f.onward_dep_time for f in fs})
+    departure_from = departures[len(departures) // 3]
+
+    def check(expected_predicate, **filters):
+        expected = [i for i, f in enumerate(fs) if expected_predicate(f)]
+        assert list(fs.select(**filters)) == expected
+        return expected
+
+    assert check(lambda f: True) == list(range(len(fs)))
+    assert check(lambda f: 'AirIndia' in f.carriers, carriers=['AirIndia'])
+    assert check(lambda f: {'AirIndia', 'Emirates'} & set(f.carriers), carriers=['AirIndia', 'Emirates'])
+    assert check(lambda f: False, carriers=['Unknown']) == []
+    assert check(lambda f: 'DEL' in f.airports and f.n_transfers == 1, airports=['DEL'], n_transfers=[1])
+    assert check(lambda f: min_price <= f.price <= max_price,
+                 min_price=to_minor_units(min_price), max_price=to_minor_units(max_price))
+    assert check(lambda f: f.onward_dep_time >= departure_from and f.price <= max_price,
+                 departure_from=to_timestamp(departure_from), max_price=to_minor_units(max_price))
+
+
+def test_flights_diff():
+    old = response_flights('one_way_with_child_and_infant.xml')
+    new = response_flights('one_way_with_child_and_infant.xml')
+    new_flight = new[0]
+    new_flight.pricing.adult += 10
+    new[1].onward_route[0].departure_datetime += timedelta(hours=1)
+    removed_key = new.keys[2]
+    new = Flights([f for i, f in enumerate(new) if i != 2])
+
+    diff = FlightsDiff(old, new)
+    assert [(old[o], new[n]) for o, n in diff.price_changes] == [(old[0], new_flight)]
+    assert [(o, n) for o, n in diff.route_changes] == [(1, 1)]
+    assert [old.keys[row] for row in diff.removed] == [removed_key]
+    assert diff.added == []
+    assert diff.unchanged == len(old) - 3
+    assert diff.as_dict(lambda f: f)['price_changes'][0]['price_delta'] == 10
+
+
+def slots(obj):
+    return {name: getattr(obj, name) for name in type(obj).__slots__}
+
+
+@pytest.mark.parametrize("file_name", ['round_trip_adult.xml', 'one_way_with_child_and_infant.xml'])
+def test_fast_and_strict_parsing(file_name):
+    path_to_file = join(FLIGHTS_INFO_DIR_PATH, file_name)
+    fast = Flights.from_flights_info(path_to_file, FlightsInfoXmlParser)
+    strict = Flights.from_flights_info(path_to_file, StrictFlightsInfoXmlParser)
+
+    assert fast.keys == strict.keys
+    assert [slots(f.pricing) for f in fast] == [slots(f.pricing) for f in strict]
+    assert [[slots(rp) for rp in f.onward_route] for f in fast] == \
+        [[slots(rp) for rp in f.onward_route] for f in strict]
+
+
+def test_compact_models():
+    flights = list(FlightsInfoXmlParser.flights(join(FLIGHTS_INFO_DIR_PATH, 'round_trip_adult.xml')))
+    first, second = flights[:2]
+
+    for obj in (first, first.pricing, first.onward_route, first.onward_route[0]):
+        assert not hasattr(obj, '__dict__')
+    assert first.onward_route[0].source is second.onward_route[0].source
+    assert first.pricing.currency is second.pricing.currency
+
+    assert first.carriers is first.carriers
+    same_carriers = [f for f in flights if sorted(f.carriers) == sorted(first.carriers)]
+    assert all(f.carriers is first.carriers for f in same_carriers)
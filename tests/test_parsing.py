@@ -0,0 +1,90 @@
+from os.path import join
+
+import gevent
+import pytest
+
+from aviasales.models import FlightsInfoXmlParser, Flights, Route, StrictFlightsInfoXmlParser
+from aviasales.parsing import flight_element_ranges, parse_flights, parse_in_processes, split_ranges
+from aviasales.serializers import get_serializer
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+from benchmarks.generate import ResponseGenerator
+
+PATH_TO_FILE = join(FLIGHTS_INFO_DIR_PATH, 'round_trip_adult.xml')
+
+
+def dumps(flights):
+    return get_serializer().dumps(Flights(flights, with_validate=False))
+
+
+def test_flight_element_ranges():
+    with open(PATH_TO_FILE, 'rb') as f:
+        data = f.read()
+    ranges = list(flight_element_ranges(data))
+
+    assert len(ranges) == len(list(FlightsInfoXmlParser.flights(PATH_TO_FILE)))
+    for start, end in ranges:
+        assert data[start:end].startswith(b'<Flights>') and data[start:end].endswith(b'</Flights>')
+
+    chunks = split_ranges(ranges, 7)
+    assert chunks[0][0] == ranges[0][0] and chunks[-1][1] == ranges[-1][1]
+    assert all(prev[1] <= cur[0] for prev, cur in zip(chunks, chunks[1:]))
+    assert split_ranges([], 7) == []
+
+
+def test_parse_in_processes():
+    expected = dumps(FlightsInfoXmlParser.flights(PATH_TO_FILE))
+    assert dumps(parse_in_processes(FlightsInfoXmlParser, PATH_TO_FILE, n_chunks=3)) == expected
+
+
+@pytest.mark.parametrize("mode", ['inline', 'threadpool', 'processes'])
+def test_parse_modes(mode):
+    expected = dumps(FlightsInfoXmlParser.flights(PATH_TO_FILE))
+    assert dumps(parse_flights(FlightsInfoXmlParser, PATH_TO_FILE, mode)) == expected
+
+
+def test_threadpool_parsing_does_not_block_hub():
+    ticks = []
+
+    def ticker():
+        while True:
+            ticks.append(1)
+            gevent.sleep(0.001)
+
+    t = gevent.spawn(ticker)
+    gevent.sleep(0)
+    n_ticks = len(ticks)
+    list(parse_flights(FlightsInfoXmlParser, PATH_TO_FILE, 'threadpool'))
+    t.kill()
+
+    assert len(ticks) > n_ticks
+
+
+@pytest.mark.parametrize("round_trip, with_child, with_infant", [
+    (True, False, False),
+    (False, True, True),
+])
+def test_generated_response(tmp_path, round_trip, with_child, with_infant):
+    path = str(tmp_path / 'generated.xml')
+    generator = ResponseGenerator(round_trip=round_trip, with_child=with_child, with_infant=with_infant,
+                                  carriers={'EK': 1, 'QR': 1}, transfers={0: 1, 2: 1}, interline=0)
+    generator.write(path, 300)
+
+    flights = Flights.from_flights_info(path, FlightsInfoXmlParser)
+    assert len(flights) == 300
+    assert set(flights.general_info['carriers']) == {'Emirates', 'Qatar Airways'}
+    assert set(flights.general_info['n_transfers']) <= {0, 2, 4}
+    for flight in flights:
+        assert isinstance(flight.return_route, Route) == round_trip
+        assert (flight.pricing.child is not None) == with_child
+        assert (flight.pricing.infant is not None) == with_infant
+        assert flight.onward_route.source == 'DXB' and flight.onward_route.destination == 'BKK'
+        assert all(rp.departure_datetime < rp.arrival_datetime for rp in flight.onward_route)
+
+    # строгий разбор принимает сгенерированные значения
+    assert len(list(StrictFlightsInfoXmlParser.flights(path))) == 300
+
+
+def test_parser_releases_parsed_elements():
+    # уже разобранные элементы удаляются из дерева (кроме предыдущего)
+    positions = [element.getparent().index(element) for element in FlightsInfoXmlParser._flight_elements(PATH_TO_FILE)]
+    assert max(positions) == 1
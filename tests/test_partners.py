@@ -0,0 +1,54 @@
+import pytest
+
+from aviasales.exceptions import FlightsNotFound
+from aviasales.partners import FanOutSearch
+
+
+def statuses(reports):
+    return {report.name: report.status for report in reports}
+
+
+def test_fan_out_merges_and_deduplicates(mock_partner):
+    first = mock_partner('first')
+    cheaper_duplicate = mock_partner('cheaper_duplicate', price_delta=-1)
+    other = mock_partner('other', file_name='one_way_with_child_and_infant.xml')
+
+    flights, reports = FanOutSearch([first, cheaper_duplicate, other], deadline=5).search(q='1')
+
+    assert statuses(reports) == {'first': 'ok', 'cheaper_duplicate': 'ok', 'other': 'ok'}
+    first_flights, _ = FanOutSearch([first], deadline=5).search(q='1')
+    other_flights, _ = FanOutSearch([other], deadline=5).search(q='1')
+    assert len(flights) == len(set(first_flights.keys)) + len(set(other_flights.keys))
+    assert len(set(flights.keys)) == len(flights)
+
+    # из одинаковых перелетов остается самый дешевый
+    cheapest = {}
+    for f in first_flights:
+        cheapest[f.key] = min(cheapest.get(f.key, f.price), f.price)
+    for key, flight in zip(flights.keys, flights):
+        if key in cheapest:
+            assert flight.price == cheapest[key] - 1
+
+    # результаты партнеров кэшируются
+    assert first.n_calls == 1
+
+
+def test_fan_out_deadline_and_errors(mock_partner):
+    fast = mock_partner('fast')
+    slow = mock_partner('slow', file_name='one_way_with_child_and_infant.xml', delay=1)
+    broken = mock_partner('broken', exception=ValueError)
+
+    flights, reports = FanOutSearch([fast, slow, broken], deadline=0.3).search(q='2')
+
+    assert statuses(reports) == {'fast': 'ok', 'slow': 'timeout', 'broken': 'error'}
+    assert [r.quantity for r in reports] == [len(flights), 0, 0]
+    assert all(r.time < 0.6 for r in reports)
+
+    flights, reports = FanOutSearch([fast, slow, broken], deadline=0.3).search(deadline=5, q='2')
+    assert statuses(reports)['slow'] == 'timeout'
+
+
+def test_fan_out_not_found(mock_partner):
+    partners = [mock_partner('a', exception=FlightsNotFound), mock_partner('b', exception=FlightsNotFound)]
+    with pytest.raises(FlightsNotFound):
+        FanOutSearch(partners).search(q='3')
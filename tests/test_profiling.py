@@ -0,0 +1,70 @@
+import pstats
+
+import gevent
+from bottle import Bottle
+from webtest import TestApp
+
+from aviasales.profiling import ProfilingPlugin
+from aviasales.views import logic
+from aviasales.wsgi import app
+
+TRUSTED = {'REMOTE_ADDR': '127.0.0.1'}
+
+
+def spawned_work():
+    return sum(range(1000))
+
+
+def profiled_app(tmpdir, **kwargs):
+    plugin_app = Bottle()
+    plugin_app.install(ProfilingPlugin(dir_path=str(tmpdir), **kwargs))
+
+    @plugin_app.route('/work')
+    def work():
+        return str(gevent.spawn(spawned_work).get())
+
+    return TestApp(plugin_app)
+
+
+def test_profile_includes_spawned_greenlets(tmpdir):
+    response = profiled_app(tmpdir, min_interval=0).get('/work', headers={'X-Profile': '1'}, extra_environ=TRUSTED)
+
+    files = tmpdir.listdir()
+    assert [f.basename for f in files] == [response.headers['X-Profile']]
+    functions = {name for _, _, name in pstats.Stats(str(files[0])).stats}
+    assert 'spawned_work' in functions
+
+
+def test_profile_only_on_demand_from_trusted_addresses(tmpdir):
+    test_app = profiled_app(tmpdir, min_interval=0)
+
+    assert 'X-Profile' not in test_app.get('/work', extra_environ=TRUSTED).headers
+    response = test_app.get('/work?profile', extra_environ={'REMOTE_ADDR': '10.0.0.1',
+                                                            'HTTP_X_FORWARDED_FOR': '127.0.0.1'})
+    assert 'X-Profile' not in response.headers
+    assert tmpdir.listdir() == []
+
+
+def test_profile_rate_limit(tmpdir):
+    test_app = profiled_app(tmpdir, min_interval=60)
+
+    assert test_app.get('/work?profile', extra_environ=TRUSTED).headers['X-Profile'].endswith('.prof')
+    assert test_app.get('/work?profile', extra_environ=TRUSTED).headers['X-Profile'] == 'rate-limited'
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_old_profiles_removed(tmpdir):
+    test_app = profiled_app(tmpdir, min_interval=0, max_files=2)
+
+    names = [test_app.get('/work?profile', extra_environ=TRUSTED).headers['X-Profile'] for _ in range(4)]
+    assert sorted(f.basename for f in tmpdir.listdir()) == names[2:]
+
+
+def test_profile_search(tmpdir, monkeypatch):
+    plugin, = [plugin for plugin in logic.plugins if isinstance(plugin, ProfilingPlugin)]
+    monkeypatch.setattr(plugin, 'dir_path', str(tmpdir))
+    monkeypatch.setattr(plugin, '_last_started', None)
+
+    response = TestApp(app).get('/api/cheapest?profile=1', extra_environ=TRUSTED)
+    assert response.json
+    assert [f.basename for f in tmpdir.listdir()] == [response.headers['X-Profile']]
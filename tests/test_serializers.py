@@ -0,0 +1,25 @@
+from glob import glob
+
+import pytest
+import simplejson
+
+from aviasales.models import FlightsInfoXmlParser, Flights
+from aviasales.serializers import get_serializer
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+
+
+@pytest.mark.parametrize("path_to_file", sorted(glob(FLIGHTS_INFO_DIR_PATH + '/*.xml')))
+def test_fast_serializer_golden_output(path_to_file):
+    fs = Flights.from_flights_info(path_to_file, FlightsInfoXmlParser)
+    marshmallow, fast = get_serializer('marshmallow'), get_serializer('fast')
+
+    expected = simplejson.dumps(marshmallow.flights(fs))
+    assert fast.dumps(fs) == expected
+    assert simplejson.dumps(fast.flights(fs)) == expected
+    assert marshmallow.dumps(fs) == expected
+
+    top = fs.top(field_name='optimality')
+    assert fast.dumps(top) == marshmallow.dumps(top)
+    assert fast.dumps([]) == marshmallow.dumps([])
+
+    assert fast.dumps_general_info(fs.general_info) == marshmallow.dumps_general_info(fs.general_info)
@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import shutil
+import time
+from os.path import join
+
+import pytest
+
+from aviasales.columns import FlightsColumns
+from aviasales.models import FlightsInfoXmlParser, Flights
+from aviasales.serializers import get_serializer
+from aviasales.settings import FLIGHTS_INFO_DIR_PATH
+from aviasales.storage import FlightsCodec, FlightsDiskCache, StoredFlights
+
+
+@pytest.mark.parametrize("file_name", ['round_trip_adult.xml', 'one_way_with_child_and_infant.xml'])
+def test_codec(file_name):
+    fs = Flights.from_flights_info(join(FLIGHTS_INFO_DIR_PATH, file_name), FlightsInfoXmlParser)
+    loaded = FlightsCodec.loads(FlightsCodec.dumps(fs))
+
+    # колонки и общая информация восстанавливаются без создания перелетов
+    assert isinstance(loaded.flights, StoredFlights)
+    for f_name in FlightsColumns.array_fields:
+        assert getattr(loaded.columns, f_name) == getattr(fs.columns, f_name)
+    for f_name, value in fs.general_info.items():
+        expected = sorted(value) if isinstance(value, list) else value
+        assert (sorted(loaded.general_info[f_name]) if isinstance(value, list) else loaded.general_info[f_name]) \
+            == expected
+    assert [f.key for f in loaded.top('optimality')] == [f.key for f in fs.top('optimality')]
+
+    serializer = get_serializer('fast')
+    assert serializer.dumps(loaded) == serializer.dumps(fs)
+    assert loaded.keys == fs.keys
+    assert [f.key for f in loaded[-3:]] == fs.keys[-3:]
+
+
+def test_disk_cache(tmp_path):
+    source_path = str(tmp_path / 'round_trip_adult.xml')
+    shutil.copy(join(FLIGHTS_INFO_DIR_PATH, 'round_trip_adult.xml'), source_path)
+    cache = FlightsDiskCache(str(tmp_path / 'cache'))
+
+    assert cache.load(source_path) is None
+
+    fs = Flights.from_flights_info(source_path, FlightsInfoXmlParser)
+    cache.save(source_path, fs)
+    loaded = cache.load(source_path)
+    assert loaded is not None and len(loaded) == len(fs)
+
+    # изменение исходного файла делает запись недействительной
+    stat = os.stat(source_path)
+    os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert cache.load(source_path) is None
+
+    # поврежденная запись не загружается
+    cache.save(source_path, fs)
+    with open(cache._path(source_path), 'r+b') as f:
+        f.write(b'XXXX')
+    assert cache.load(source_path) is None
+
+    assert FlightsDiskCache(None).load(source_path) is None
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:len(data) // 2],
+    lambda data: data[:FlightsCodec.HEADER.size],
+    lambda data: data[:-1] + bytes([data[-1] ^ 1]),
+    lambda data: b'',
+])
+def test_damaged_entry_is_replaced(tmp_path, monkeypatch, damage):
+    from aviasales import tasks
+
+    source_path = str(tmp_path / 'round_trip_adult.xml')
+    shutil.copy(join(FLIGHTS_INFO_DIR_PATH, 'round_trip_adult.xml'), source_path)
+    cache = FlightsDiskCache(str(tmp_path / 'cache'))
+    monkeypatch.setattr(tasks, 'flights_store', cache)
+
+    n_flights = len(tasks.load_flights(source_path))
+    with open(cache._path(source_path), 'r+b') as f:
+        data = damage(f.read())
+        f.seek(0)
+        f.truncate()
+        f.write(data)
+
+    with pytest.raises(ValueError):
+        FlightsCodec.loads(data)
+    assert cache.load(source_path) is None
+    # запись заменяется при следующей загрузке
+    assert len(tasks.load_flights(source_path)) == n_flights
+    assert len(cache.load(source_path)) == n_flights
+
+
+def test_unavailable_cache_dir(monkeypatch):
+    from aviasales import tasks
+
+    # каталог в /proc не создать даже root
+    monkeypatch.setattr(tasks, 'flights_store', FlightsDiskCache('/proc/aviasales_cache'))
+    source_path = join(FLIGHTS_INFO_DIR_PATH, 'round_trip_adult.xml')
+    assert len(tasks.load_flights(source_path)) == len(
+        Flights.from_flights_info(source_path, FlightsInfoXmlParser))
+
+
+def test_failed_save_removes_tmp_file(tmp_path, monkeypatch):
+    source_path = join(FLIGHTS_INFO_DIR_PATH, 'round_trip_adult.xml')
+    cache = FlightsDiskCache(str(tmp_path))
+
+    def replace(*args):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(os, 'replace', replace)
+    cache.save(source_path, Flights.from_flights_info(source_path, FlightsInfoXmlParser))
+    assert os.listdir(str(tmp_path)) == []
+    assert cache.load(source_path) is None
+
+
+def load_in_process(source_path, cache_dir, barrier, results):
+    from aviasales import tasks
+
+    parsed = []
+
+    def parse_flights(*args):
+        parsed.append(True)
+        time.sleep(0.5)
+        return tasks.FlightsInfoXmlParser.flights(args[1])
+
+    tasks.flights_store = FlightsDiskCache(cache_dir)
+    tasks.parse_flights = parse_flights
+    barrier.wait()
+    results.put((len(tasks.load_flights(source_path)), bool(parsed)))
+
+
+def test_store_single_flight(tmp_path):
+    source_path = str(tmp_path / 'round_trip_adult.xml')
+    shutil.copy(join(FLIGHTS_INFO_DIR_PATH, 'round_trip_adult.xml'), source_path)
+    n_workers = 4
+
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(n_workers)
+    results = ctx.Queue()
+    workers = [ctx.Process(target=load_in_process, args=(source_path, str(tmp_path / 'cache'), barrier, results))
+               for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    loaded = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    # файл разобран одним воркером, остальные взяли результат из общего кэша
+    n_flights = len(Flights.from_flights_info(source_path, FlightsInfoXmlParser))
+    assert sorted(loaded) == [(n_flights, False)] * (n_workers - 1) + [(n_flights, True)]
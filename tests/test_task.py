@@ -1,7 +1,11 @@
-import pytest
+from time import monotonic
+
 import gevent
+import pytest
+from cachetools import TTLCache
 
-from aviasales.task import task, t_cached
+from aviasales.exceptions import TimeoutException
+from aviasales.task import Task, TaskRefresher, task, t_cached
 
 
 class NoCacheChecker:
@@ -42,6 +46,15 @@ def test_task_cache(task, args, kwargs, cnt):
     assert no_cache_checker.cnt == cnt
 
 
+def test_service_kwargs():
+    service_kwargs = Task.service_kwargs(func_name_for_cache='f')
+    assert Task.split_service_kwargs(dict(service_kwargs, a=1)) == (service_kwargs, {'a': 1})
+
+    t = Task(lambda **kwargs: kwargs, a=1, **service_kwargs)
+    t.run()
+    assert t.result == {'a': 1}
+
+
 def test_task_async_work():
     cache_checker = NoCacheChecker()
 
@@ -75,3 +88,99 @@ def test_task_async_work():
     t4 = gevent.spawn(do_task, long_task, exception=Exception)
     t4.join()
     assert cache_checker.cnt == 3
+
+
+def test_task_progress():
+    @task(with_progress=True)
+    def producer(n, progress):
+        for i in range(n):
+            progress.publish(i)
+            if i % 10 == 9:
+                gevent.sleep(0.01)
+        return list(range(n))
+
+    received = []
+
+    def consume(t):
+        for item in t.iter_progress():
+            received.append((item, t.running))
+
+    t = producer(100)
+    gevent.spawn(consume, t).join()
+
+    assert [item for item, _ in received] == list(range(100))
+    # часть результатов получена до завершения задачи
+    assert any(running for _, running in received)
+
+    # для завершенной задачи результаты берутся из итогового значения
+    assert list(t.iter_progress()) == list(range(100))
+
+
+def test_task_result_wakes_waiters():
+    finished = []
+
+    @task()
+    def short_task():
+        gevent.sleep(0.05)
+        finished.append(monotonic())
+        return 1
+
+    t = short_task()
+    woken = []
+
+    def wait():
+        assert t.result == 1
+        woken.append(monotonic())
+
+    gevent.joinall([gevent.spawn(wait) for _ in range(100)])
+
+    assert len(woken) == 100
+    # ожидающие возобновляются сразу по завершении задачи, а не на следующем тике опроса
+    assert max(woken) - finished[0] < 0.05
+
+
+def test_task_timeout():
+    @task(timeout=0.05)
+    def endless_task():
+        gevent.sleep(10)
+
+    t = endless_task()
+    started = monotonic()
+    with pytest.raises(TimeoutException):
+        t.result
+    assert monotonic() - started < 1
+    assert t.running is False
+
+
+def test_stale_while_revalidate():
+    cache_checker = NoCacheChecker()
+    fail = []
+
+    @t_cached(cache=TTLCache(maxsize=10, ttl=10), soft_ttl=0.1, refresher=TaskRefresher(max_refreshes=1))
+    @task()
+    def refreshed_task(key):
+        gevent.sleep(0.05)
+        if fail:
+            raise ValueError
+        cache_checker.value
+        return key, cache_checker.cnt
+
+    assert refreshed_task('a').result == ('a', 1)
+    assert refreshed_task('b').result == ('b', 2)
+    gevent.sleep(0.15)
+
+    # устаревший результат отдается сразу, обновление идет в фоне и только одно
+    started = monotonic()
+    assert refreshed_task('a').result == ('a', 1)
+    assert refreshed_task('a').result == ('a', 1)
+    assert refreshed_task('b').result == ('b', 2)
+    assert monotonic() - started < 0.05
+    gevent.sleep(0.1)
+    assert cache_checker.cnt == 3
+    assert refreshed_task('a').result == ('a', 3)
+
+    # неудачное обновление не заменяет старый результат
+    fail.append(True)
+    refreshed_task('b')
+    gevent.sleep(0.1)
+    assert refreshed_task('b').result == ('b', 2)
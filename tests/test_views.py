@@ -1,7 +1,14 @@
+import json
+
 import pytest
 from webtest import TestApp
 
+from aviasales.cache import MemoryBoundedCache, estimated_size
+from aviasales.responses import ResponseCache
+from aviasales.task import task_cache
+from aviasales.tasks import get_flights_task
 from aviasales.views import logic
+from tests.test_models import response_flights
 
 
 @pytest.mark.parametrize("path, get_params, expected_status", [
@@ -14,8 +21,170 @@ from aviasales.views import logic
     ('/cheapest', None, 200),
     ('/fastest', None, 200),
     ('/optimal', None, 200),
+    ('/optimal', 'price_weight=0.5&n_transfers_weight=0.5', 200),
+    ('/optimal', 'time_weight=-1', 400),
+    ('/optimal', 'transfer_time_weight=inf', 400),
+    ('/most_expensive', None, 200),
+    ('/slowest', 'one_way&with_child&with_infant', 200),
+    ('/cheapest', 'limit=5&offset=5', 200),
+    ('/cheapest', 'limit=-1', 400),
+    ('/fastest', 'offset=abc', 400),
+    ('/all', 'carrier=AirIndia&n_transfers=1&limit=5', 200),
+    ('/all', 'min_price=abc', 400),
+    ('/all', 'min_price=1e999999', 400),
+    ('/all', 'max_price=1e999990', 400),
+    ('/all', 'max_price=1e16', 200),
+    ('/all', 'departure_from=2018-10-22', 200),
+    ('/all', 'departure_to=yesterday', 400),
+    ('/all', 'departure_from=0001-01-01T00:00:00%2B01:00', 400),
+    ('/all', 'departure_to=9999-12-31T23:59:59-01:00', 400),
+    ('/diff', 'new=one_way,with_child,with_infant', 200),
+    ('/diff', 'new=unknown_param', 404),
+    ('/fan_out', 'one_way&with_child&with_infant', 200),
+    ('/fan_out', 'unknown_param', 404),
+    ('/fan_out', 'deadline=-1', 400),
 ])
 def test_api(path, get_params, expected_status):
     app = TestApp(logic)
 
     assert app.get(path +'?%s' % (get_params or ''), status=expected_status).status_code == expected_status
+
+
+def test_top_pagination():
+    app = TestApp(logic)
+
+    first_page = app.get('/cheapest?limit=3').json['flights']
+    second_page = app.get('/cheapest?limit=3&offset=3').json['flights']
+    assert len(first_page) == len(second_page) == 3
+    assert app.get('/cheapest?limit=6').json['flights'] == first_page + second_page
+
+
+def test_optimal_weights():
+    app = TestApp(logic)
+
+    by_price = app.get('/optimal?price_weight=1&time_weight=0&limit=5')
+    assert by_price.json == app.get('/cheapest?limit=5').json
+    assert app.get('/optimal?time_weight=1&price_weight=0&limit=5').json == app.get('/fastest?limit=5').json
+    assert app.get('/optimal?price_weight=2&time_weight=0&limit=5').headers['ETag'] == by_price.headers['ETag']
+
+
+@pytest.mark.parametrize("path", ['/all', '/general_info', '/cheapest?limit=3', '/optimal'])
+def test_response_cache(path):
+    app = TestApp(logic)
+
+    res = app.get(path)
+    assert res.content_type == 'application/json'
+    etag = res.headers['ETag']
+
+    assert app.get(path).body == res.body
+    assert app.get(path, headers={'If-None-Match': etag}, status=304).body == b''
+    assert app.get(path, headers={'If-None-Match': '"other"'}, status=200).body == res.body
+
+
+@pytest.mark.parametrize("get_params", ['', 'one_way&with_child&with_infant'])
+def test_all_streaming(get_params):
+    app = TestApp(logic)
+    expected = app.get('/all?' + get_params).body
+
+    res = app.get('/all?stream&' + get_params)
+    assert res.content_type == 'application/json'
+    assert res.body == expected
+
+    res = app.get('/all?stream=ndjson&' + get_params)
+    assert res.content_type == 'application/x-ndjson'
+    lines = res.body.decode().splitlines()
+    assert len(lines) == app.get('/general_info?' + get_params).json['quantity']
+    assert [json.loads(line) for line in lines] == json.loads(expected)['flights']
+
+    app.get('/all?stream&unknown_param', status=404)
+    app.get('/all?stream=xml', status=400)
+
+
+def test_filters():
+    app = TestApp(logic)
+    flights = app.get('/all').json['flights']
+
+    res = app.get('/all?carrier=AirIndia&carrier=Emirates&max_price=700')
+    expected = [f for f in flights
+                if {'AirIndia', 'Emirates'} & set(f['carriers']) and f['price'] <= 700]
+    assert expected and res.json['flights'] == expected
+    assert app.get('/all?carrier=AirIndia&carrier=Emirates&max_price=700&limit=2&offset=1').json['flights'] == \
+        expected[1:3]
+    assert app.get('/all?stream&carrier=AirIndia&carrier=Emirates&max_price=700').json['flights'] == expected
+
+    res = app.get('/cheapest?n_transfers=0&departure_from=2018-10-22T12:00:00%2B00:00')
+    expected = sorted((f for f in flights if f['n_transfers'] == 0 and f['onward_dep_time'] >= '2018-10-22T12:00'),
+                      key=lambda f: f['price'])[:10]
+    assert expected and res.json['flights'] == expected
+
+
+def test_diff():
+    app = TestApp(logic)
+
+    res = app.get('/diff?old=&new=one_way,with_child,with_infant').json
+    old_quantity = app.get('/general_info').json['quantity']
+    new_quantity = app.get('/general_info?one_way&with_child&with_infant').json['quantity']
+    assert res['old_quantity'] == old_quantity and res['new_quantity'] == new_quantity
+    assert res['unchanged'] + len(res['price_changes']) + len(res['route_changes']) + len(res['added']) == \
+        new_quantity
+    assert res['unchanged'] + len(res['price_changes']) + len(res['route_changes']) + len(res['removed']) == \
+        old_quantity
+    assert res['route_changes']
+    for change in res['route_changes']:
+        assert change['old']['return_route'] != change['new']['return_route']
+
+    res = app.get('/diff?new=').json
+    assert res['unchanged'] == old_quantity
+    assert not (res['added'] or res['removed'] or res['price_changes'] or res['route_changes'])
+
+
+def test_fan_out():
+    app = TestApp(logic)
+
+    res = app.get('/fan_out?deadline=10').json
+    assert [report['name'] for report in res['partners']] == ['default']
+    assert res['partners'][0]['status'] == 'ok'
+    assert res['partners'][0]['quantity'] == app.get('/general_info').json['quantity']
+    assert len(res['flights']) <= res['partners'][0]['quantity']
+
+
+def test_equivalent_searches_share_cache_entry():
+    app = TestApp(logic)
+    queries = [
+        'one_way&with_child&with_infant',
+        'with_infant&with_child&one_way',
+        'one_way=1&with_child=true&with_infant=&with_infant',
+        'one_way&with_child&with_infant&utm_source=mail&limit=3',
+    ]
+    for query in queries:
+        app.get('/cheapest?' + query)
+
+    t = get_flights_task(one_way='', with_child='', with_infant='')
+    assert [v for v in task_cache.values() if v is t] == [t]
+    assert get_flights_task(one_way='yes', with_infant='', with_child='', foo='bar') is t
+
+    hits = task_cache.hits
+    for query in queries:
+        app.get('/fastest?' + query)
+    assert task_cache.hits == hits + len(queries)
+
+
+def test_response_cache_is_bounded_and_counted():
+    flights = response_flights('round_trip_adult.xml')
+    cache = MemoryBoundedCache(maxsize=10 ** 9, ttl=10, getsizeof=estimated_size)
+    cache['flights'] = flights
+    flights.on_size_change = lambda: cache.resize('flights', flights)
+    responses = ResponseCache(max_bytes=3000)
+
+    size = cache.currsize
+    body = responses.get(flights, 'a', lambda: 'a' * 1000).body
+    assert responses.get(flights, 'a', lambda: 'other').body == body
+    assert cache.currsize >= size + 1000
+
+    for key in 'bcd':
+        responses.get(flights, key, lambda: key * 1000)
+    assert flights.responses.currsize <= 3000
+    assert 'a' not in flights.responses
+    # ответ больше всего кэша отдается, но не хранится
+    assert responses.get(flights, 'e', lambda: 'e' * 5000).body == b'e' * 5000
+    assert 'e' not in flights.responses